@@ -0,0 +1,221 @@
+"""Time the cog's hot paths: query parsing, skill lookup, rolls, sheet parsing and rendering.
+
+Needs the cog's own dependencies installed, but no running bot; Config and the command
+context are faked (see fakes.py) and characters come from the sheets in fixtures/.
+
+Run from the repository root:
+    python benchmarks/bench_cog.py
+    python benchmarks/bench_cog.py --json results.json
+    python benchmarks/bench_cog.py --compare results.json
+"""
+import argparse
+import asyncio
+import csv
+import datetime
+import json
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import timeit
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from cthulhucaller import cthulhucaller as cog_module
+from cthulhucaller.cthulhucaller import Character
+
+from fakes import FakeContext, FakeUser, command_callback, fake_cog
+
+FIXTURES = pathlib.Path(__file__).resolve().parent / "fixtures"
+
+QUERIES = {
+    'plain': "spot hidden",
+    'flags': "spot hidden -bonus 1 -penalty 1d2 -rr 3",
+    'phrase': "library use -phrase \"I pore over the crumbling pages of the tome\" -bonus 1"
+}
+
+SKILL_LOOKUPS = ["spot hidden", "latin", "dodge", "luck", "str", "photo", "fighting", "handgun"]
+
+# how much slower than the baseline a benchmark may get before --compare flags it
+REGRESSION_THRESHOLD = 0.10
+
+
+def load_fixture(name: str):
+    with open(FIXTURES / name, newline="") as f:
+        return list(csv.reader(f))
+
+
+class Timer:
+    """Collects timings for named benchmarks, sync or async."""
+
+    def __init__(self, loop, repeat: int):
+        self.loop = loop
+        self.repeat = repeat
+        self.results = {}
+
+    def time(self, name: str, func):
+        timer = timeit.Timer(func)
+        number, _ = timer.autorange()
+        self._record(name, number, timer.repeat(repeat=self.repeat, number=number))
+
+    def time_async(self, name: str, make_coro):
+        async def run(number):
+            for _ in range(number):
+                await make_coro()
+
+        # run a whole batch per loop turn so the event loop's own overhead stays out of it
+        timer = timeit.Timer(lambda: self.loop.run_until_complete(run(self._batch)))
+        self._batch = 1
+        while timer.timeit(number=1) < 0.2 and self._batch < 1_000_000:
+            self._batch *= 10
+        self._record(name, self._batch, timer.repeat(repeat=self.repeat, number=1))
+
+    def _record(self, name: str, number: int, runs: list):
+        per_call = [run / number * 1e6 for run in runs]
+        self.results[name] = {
+            'mean_us': statistics.mean(per_call),
+            'min_us': min(per_call),
+            'stdev_us': statistics.stdev(per_call) if len(per_call) > 1 else 0.0,
+            'number': number,
+            'repeat': len(per_call)
+        }
+        print(f"{name:<36}{min(per_call):>12.2f}{statistics.mean(per_call):>12.2f}")
+
+
+async def seed_character(cog, user, rows: list):
+    """Store a character straight from sheet rows, the way import does after fetching."""
+    sheet_id = f"fixture-{user.id}"
+    char = Character.from_sheet(cog.read_char_data(rows))
+    await cog._set_character(user, sheet_id, char, {'balances': cog._get_starting_balances(char)})
+    await cog._set_names(user, {sheet_id: char.name})
+    await cog._set_user_value(user, 'active_char', sheet_id)
+    return sheet_id, char
+
+
+def run_benchmarks(loop, repeat: int):
+    timer = Timer(loop, repeat)
+    print(f"{'benchmark':<36}{'min (us)':>12}{'mean (us)':>12}")
+
+    with fake_cog(cog_module, loop) as cog:
+        for name, query in QUERIES.items():
+            timer.time(f"process_query[{name}]", lambda: cog.process_query(query))
+
+        for fixture in ["investigator.csv", "veteran.csv"]:
+            rows = load_fixture(fixture)
+            label = fixture.split(".")[0]
+            char_data = cog.read_char_data(rows)
+
+            timer.time(f"read_char_data[{label}]", lambda: cog.read_char_data(rows))
+            timer.time(f"is_char_data_valid[{label}]", lambda: cog._is_char_data_valid(char_data))
+            timer.time(f"character_from_sheet[{label}]", lambda: Character.from_sheet(char_data))
+
+        user = FakeUser(1)
+        ctx = FakeContext(user)
+        sheet_id, char = loop.run_until_complete(
+            seed_character(cog, user, load_fixture("veteran.csv")))
+        _, settings = loop.run_until_complete(cog._get_character(user, sheet_id))
+        balances = settings['balances']
+        index = cog._get_skill_index(user, sheet_id, char)
+
+        def find_all():
+            for query in SKILL_LOOKUPS:
+                cog.find_skill(query, char, balances, index)
+
+        def find_all_unindexed():
+            for query in SKILL_LOOKUPS:
+                cog.find_skill(query, char, balances)
+
+        timer.time(f"find_skill[x{len(SKILL_LOOKUPS)}]", find_all)
+        timer.time(f"find_skill_unindexed[x{len(SKILL_LOOKUPS)}]", find_all_unindexed)
+        timer.time("calculate_damage_build_mov", lambda: cog.calculate_damage_build_mov(char))
+
+        timer.time("perform_skill_roll", lambda: cog._perform_skill_roll(55, "", "", False))
+        timer.time("perform_skill_roll[bonus]", lambda: cog._perform_skill_roll(55, "2", "", False))
+        for count in [25, 1000, 10000]:
+            timer.time(f"summarize_skill_rolls[{count}]",
+                lambda: cog.summarize_skill_rolls(55, "1d2", "", "Dodge", count, True))
+
+        sheet = command_callback(cog, "sheet")
+        check = command_callback(cog, "check")
+
+        def render_cold():
+            cog._sheet_embeds.clear()
+            return sheet(ctx)
+
+        timer.time_async("sheet[cold]", render_cold)
+        timer.time_async("sheet[cached]", lambda: sheet(ctx))
+        timer.time_async("check[skill]", lambda: check(ctx, query="spot hidden"))
+        timer.time_async("check[rr 8]", lambda: check(ctx, query="dodge -bonus 1 -rr 8"))
+        timer.time_async("check[rr 1000]", lambda: check(ctx, query="dodge -rr 1000"))
+
+        loop.run_until_complete(cog.session.close())
+
+    return timer.results
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline_path: str, threshold: float):
+    """Print each benchmark against a saved run. Returns whether any got slower than allowed."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+
+    regressed = False
+    print()
+    print(f"{'benchmark':<36}{'baseline (us)':>14}{'now (us)':>12}{'change':>10}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]['min_us']
+        change = result['min_us'] / before - 1
+        flag = ""
+        if change > threshold:
+            flag = "  slower"
+            regressed = True
+        print(f"{name:<36}{before:>14.2f}{result['min_us']:>12.2f}{change:>+10.1%}{flag}")
+
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--json", metavar="PATH", help="write the results to this file")
+    parser.add_argument("--compare", metavar="PATH", help="compare against results saved earlier")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+        help="slowdown that counts as a regression when comparing (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark")
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        results = run_benchmarks(loop, args.repeat)
+    finally:
+        loop.close()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                'meta': {
+                    'revision': git_revision(),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'time': datetime.datetime.now(datetime.timezone.utc).isoformat()
+                },
+                'results': results
+            }, f, indent=2)
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
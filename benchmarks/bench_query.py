@@ -0,0 +1,84 @@
+"""Compare the query tokenizer against the find-based parser it replaced.
+
+Run from the repository root:
+    python benchmarks/bench_query.py
+"""
+import pathlib
+import sys
+import timeit
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from cthulhucaller.query import DOUBLE_QUOTES, KNOWN_FLAGS, get_base_flags, parse_query
+
+QUERIES = {
+    'plain': "spot hidden",
+    'flags': "spot hidden -bonus 1 -penalty 1d2 -rr 3",
+    'phrase': "library use -phrase \"" + "I pore over the crumbling pages of the tome " * 6 + \
+        "\" -bonus 1 -rr 2",
+    'many_phrases': " ".join(["-phrase \"the thing in the cellar stirs again, louder\""] * 12) + \
+        " -bonus 1 -penalty 1 -rr 4",
+    'long_words': "psychology " + " ".join(["-phrase whispering bonus penalty words"] * 20)
+}
+
+
+def legacy_parse_query(query_str: str):
+    """The parser from before the tokenizer, kept here to compare against."""
+    processed_flags = get_base_flags()
+
+    query_str = " " + query_str + " "
+
+    flag_locs = []
+    search_start = 0
+    while search_start < len(query_str):
+        next_flags = [query_str.find(f" -{flag} ", search_start) for flag in KNOWN_FLAGS]
+
+        if all([f < 0 for f in next_flags]):
+            break
+        else:
+            while -1 in next_flags:
+                next_flags.remove(-1)
+            next_flag = min(next_flags)
+            flag_locs.append(next_flag)
+            search_start = next_flag + 2
+    flag_locs.sort()
+
+    if not flag_locs:
+        processed_flags['query'] = query_str.strip()
+    else:
+        processed_flags['query'] = query_str[:flag_locs[0]].strip()
+
+    for i in range(len(flag_locs)):
+        if i == len(flag_locs) - 1:
+            flag_and_arg = query_str[flag_locs[i]:]
+        else:
+            flag_and_arg = query_str[flag_locs[i]:flag_locs[i + 1]]
+
+        flag_and_arg = flag_and_arg.strip()[1:].split(" ", 1)
+
+        flag = flag_and_arg[0]
+        arg = flag_and_arg[1] if len(flag_and_arg) > 1 else ""
+
+        arg = arg.strip()
+        if len(arg) > 1 and arg[0] in DOUBLE_QUOTES and arg[-1] in DOUBLE_QUOTES:
+            arg = arg[1:-1]
+
+        processed_flags[flag].append(arg)
+
+    return processed_flags
+
+
+def main():
+    number = 20000
+    print(f"{'query':<14}{'legacy (us)':>14}{'tokenizer (us)':>16}{'speedup':>10}")
+    for name, query in QUERIES.items():
+        # none of these lean on the tokenizer's extra handling, so both should agree
+        assert parse_query(query) == legacy_parse_query(query), name
+
+        legacy = timeit.timeit(lambda: legacy_parse_query(query), number=number) / number * 1e6
+        current = timeit.timeit(lambda: parse_query(query), number=number) / number * 1e6
+        print(f"{name:<14}{legacy:>14.2f}{current:>16.2f}{legacy / current:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""In-memory stand-ins for the bot, Config and command context, just enough to drive the cog
+without a running bot or Red's storage.
+
+Values are deep-copied on the way in and out, like Red's own drivers, so the benchmarks pay a
+similar price for every Config read and write.
+"""
+import contextlib
+import copy
+import functools
+import pathlib
+import tempfile
+from unittest import mock
+
+
+class FakeValue:
+    def __init__(self, config, path: tuple, default):
+        self._config = config
+        self._path = path
+        self._default = default
+
+    async def __call__(self):
+        self._config.reads += 1
+        return copy.deepcopy(self._config.store.get(self._path, self._default))
+
+    async def set(self, value):
+        self._config.writes += 1
+        self._config.store[self._path] = copy.deepcopy(value)
+
+    async def clear(self):
+        self._config.writes += 1
+        self._config.store.pop(self._path, None)
+
+
+class FakeGroup:
+    """A group of values, or with levels, a custom group missing that many identifiers."""
+
+    def __init__(self, config, path: tuple, defaults: dict, levels: int=0):
+        self._config = config
+        self._path = path
+        self._defaults = defaults
+        self._levels = levels
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return FakeValue(self._config, self._path + (name,), self._defaults.get(name))
+
+    async def all(self):
+        self._config.reads += 1
+        store = self._config.store
+        if not self._levels:
+            return {key: copy.deepcopy(store.get(self._path + (key,), default))
+                for key, default in self._defaults.items()}
+
+        # like Red, only what has been set, nested by the missing identifiers
+        found = {}
+        for path, value in store.items():
+            if path[:len(self._path)] != self._path:
+                continue
+            current = found
+            for key in path[len(self._path):-1]:
+                current = current.setdefault(key, {})
+            current[path[-1]] = copy.deepcopy(value)
+        return found
+
+    async def get_raw(self, *keys, default=None):
+        self._config.reads += 1
+        value = self._config.store.get(self._path + keys[:1], self._defaults.get(keys[0], default))
+        for key in keys[1:]:
+            if not isinstance(value, dict) or key not in value:
+                return default
+            value = value[key]
+        return copy.deepcopy(value)
+
+    async def set_raw(self, *keys, value):
+        self._config.writes += 1
+        top = self._path + keys[:1]
+        if len(keys) == 1:
+            self._config.store[top] = copy.deepcopy(value)
+            return
+
+        current = self._config.store.setdefault(top, copy.deepcopy(self._defaults.get(keys[0], {})))
+        for key in keys[1:-1]:
+            current = current.setdefault(key, {})
+        current[keys[-1]] = copy.deepcopy(value)
+
+    async def set(self, data: dict):
+        self._config.writes += 1
+        for key, value in data.items():
+            self._config.store[self._path + (key,)] = copy.deepcopy(value)
+
+    async def clear(self):
+        self._config.writes += 1
+        for path in [p for p in self._config.store if p[:len(self._path)] == self._path]:
+            del self._config.store[path]
+
+
+class FakeConfig:
+    """Keeps every value in one dict keyed by its full path, and counts reads and writes."""
+
+    def __init__(self):
+        self.store = {}
+        self.reads = 0
+        self.writes = 0
+
+        self._global_defaults = {}
+        self._user_defaults = {}
+        self._guild_defaults = {}
+        self._custom_defaults = {}
+        self._custom_levels = {}
+
+    @classmethod
+    def get_conf(cls, cog, identifier: int, **kwargs):
+        return cls()
+
+    def register_global(self, **defaults):
+        self._global_defaults.update(defaults)
+
+    def register_user(self, **defaults):
+        self._user_defaults.update(defaults)
+
+    def register_guild(self, **defaults):
+        self._guild_defaults.update(defaults)
+
+    def init_custom(self, name: str, identifier_count: int):
+        self._custom_defaults.setdefault(name, {})
+        self._custom_levels[name] = identifier_count
+
+    def register_custom(self, name: str, **defaults):
+        self._custom_defaults.setdefault(name, {}).update(defaults)
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return FakeValue(self, ("GLOBAL", name), self._global_defaults.get(name))
+
+    def user(self, user):
+        return self.user_from_id(user.id)
+
+    def user_from_id(self, user_id: int):
+        return FakeGroup(self, ("USER", user_id), self._user_defaults)
+
+    def guild(self, guild):
+        return self.guild_from_id(guild.id)
+
+    def guild_from_id(self, guild_id: int):
+        return FakeGroup(self, ("GUILD", guild_id), self._guild_defaults)
+
+    def custom(self, name: str, *identifiers):
+        return FakeGroup(self, (name,) + tuple(str(i) for i in identifiers),
+            self._custom_defaults[name], self._custom_levels[name] - len(identifiers))
+
+    async def all_users(self):
+        return self._all("USER", self._user_defaults)
+
+    async def all_guilds(self):
+        return self._all("GUILD", self._guild_defaults)
+
+    def _all(self, scope: str, defaults: dict):
+        self.reads += 1
+        found = {}
+        for path, value in self.store.items():
+            if path[0] == scope:
+                found.setdefault(path[1], copy.deepcopy(defaults))[path[2]] = copy.deepcopy(value)
+        return found
+
+
+class FakeBot:
+    pass
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str="investigator"):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+
+
+class FakeMessage:
+    def __init__(self, attachments: list=None):
+        self.attachments = attachments or []
+
+
+class FakeContext:
+    """Swallows whatever a command sends, keeping only the last message."""
+
+    def __init__(self, author: FakeUser, message: FakeMessage=None):
+        self.author = author
+        self.message = message or FakeMessage()
+        self.sent = 0
+        self.last_sent = None
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+        self.last_sent = (content, kwargs)
+
+    async def send_help(self, *args):
+        self.sent += 1
+
+
+@contextlib.contextmanager
+def fake_cog(module, loop=None):
+    """Build the cog from the given module against a FakeConfig and a throwaway data folder.
+
+    The cog opens an aiohttp session when it is made, which aiohttp only allows inside a running
+    event loop. Given a loop that isn't running, the cog is made by running it on that loop.
+    """
+    async def make():
+        return module.CthulhuCaller(FakeBot())
+
+    with tempfile.TemporaryDirectory() as data_path, \
+        mock.patch.object(module, "Config", FakeConfig), \
+        mock.patch.object(module, "cog_data_path", lambda cog: pathlib.Path(data_path)):
+        if loop is not None:
+            yield loop.run_until_complete(make())
+        else:
+            yield module.CthulhuCaller(FakeBot())
+
+
+def command_callback(cog, name: str):
+    """Get a command's underlying coroutine, bound to the cog."""
+    command = getattr(cog, name)
+    if hasattr(command, "callback"):
+        return functools.partial(command.callback, cog)
+    return command
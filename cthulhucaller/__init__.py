@@ -1,10 +1,12 @@
 from .cthulhucaller import CthulhuCaller
 
-__red_end_user_data_statement__ = "No personal data is stored."
+__red_end_user_data_statement__ = "This cog stores imported Call of Cthulhu character " \
+    "data, and the day each user last used a command."
 
 
 async def setup(bot):
     n = CthulhuCaller(bot)
+    await n.initialize()
     if not __import__('asyncio').iscoroutinefunction(bot.add_cog):
         bot.add_cog(n)
     else:
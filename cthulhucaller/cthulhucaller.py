@@ -1,36 +1,43 @@
+import asyncio
+import codecs
 import csv
+import datetime
+import hashlib
 import io
+import json
+import logging
 import math
 import random
 import re
+import time
+
+from collections import OrderedDict
+from fractions import Fraction
 
 import aiohttp
 import discord
-import d20
 
 from redbot.core import Config, commands
+from redbot.core.data_manager import cog_data_path
+from redbot.core.utils.chat_formatting import box, pagify
+
+from .dice import FAILURE, FUMBLE_BELOW_50, LUCK_TARGETS, OUTCOME_RESEARCH_POINTS, OUTCOME_TABLE, \
+    MAX_NET_DICE, OUTCOME_TEXTS, REGULAR, TABLE_MAX_DC, PercentileDice, TooManyDice, \
+    UnrollableDice, check_odds, get_outcome, is_dice, load_d20, roll_dice, roll_total
+from .locks import LockManager
+from .metrics import Metrics
+from .party import PartyIndex, PartyMember
+from .sheetfile import FileTooBig, file_digest, file_sheet_id, is_file_sheet, read_csv_rows, \
+    read_xlsx_rows
+from .query import parse_query
+
+log = logging.getLogger("red.cthulhucaller")
 
 GSHEET_URL_TEMPLATE = r"^https://docs.google.com/spreadsheets/d/e/[0-9A-Za-z-_]+/pub\?gid=0" + \
     r"&single=true&output=csv$"
 GSHEET_URL_BASE = "https://docs.google.com/spreadsheets/d/e/{}/pub?gid=0&single=true&output=csv"
 
-KNOWN_FLAGS = ["bonus", "penalty", "phrase", "rr"]
-DOUBLE_QUOTES = ["\"", "“", "”"]
-
-# TODO: reorganize later. also maybe there's a better way?
-DATA_LOCATIONS = {
-    'name': (2, 1),
-    'luck': (15, 2),
-    'archetype': (2, 5),
-    'psychic_power': (10, 5),
-    'occupation_skill': (15, 5)
-}
-
-TALENT_LOCATIONS = [(7, 5), (8, 5)]
-
 CHARACTERISTICS = ['str', 'con', 'siz', 'dex', 'app', 'edu', 'int', 'pow']
-CHARACTERISTIC_ROW_START = 7
-CHARACTERISTIC_COL = 2
 
 SKILLS = ['Accounting', 'Animal Handling', 'Anthropology', 'Appraise', 'Archaeology', 'Artillery',
     'Charm', 'Climb', 'Credit Rating', 'Cthulhu Mythos', 'Demolitions', 'Disguise', 'Diving',
@@ -39,19 +46,66 @@ SKILLS = ['Accounting', 'Animal Handling', 'Anthropology', 'Appraise', 'Archaeol
     'Mechanical Repair', 'Medicine', 'Natural World', 'Navigate', 'Occult',
     'Operate Heavy Machinery', 'Persuade', 'Psychoanalysis', 'Psychology', 'Read Lips', 'Ride',
     'Sleight of Hand', 'Spot Hidden', 'Stealth', 'Swim', 'Throw', 'Track']
-SKILL_ROW_START = 2
-SKILL_COL = 8
-
-BLOCK_LENGTH = 5
-
-SPECIAL_ROW_STARTS = [3, 13, 23, 33]
-SPECIAL_COL_STARTS = [10, 13]
-
-CUSTOM_ROW_START = 3
-CUSTOM_COL = 16
 
 POINT_BUY_TOTAL = 460
 
+# how many other skills an ambiguous check name could have meant are listed with its roll
+ALTERNATIVES_SHOWN = 5
+
+# -rr rolls beyond this many are summarized instead of listed (embeds hold 25 fields at most)
+RR_FIELD_LIMIT = 25
+RR_MAX = 10000
+
+# a user mention in a command's text, along with the space before it
+MENTION_PATTERN = r"\s*<@!?[0-9]+>"
+
+# how many users' data snapshots, characters, characters' skill indexes and rendered sheets to
+# keep in memory at once
+USER_CACHE_SIZE = 500
+CHARACTER_CACHE_SIZE = 500
+SKILL_INDEX_CACHE_SIZE = 500
+SHEET_EMBED_CACHE_SIZE = 500
+
+# connection pool settings for the shared http session
+HTTP_POOL_SIZE = 20
+HTTP_DNS_CACHE_TTL = 300
+# how many sheets can be fetched at the same time, across all users
+SHEET_FETCH_CONCURRENCY = 5
+
+# how many sheets the background sync can be fetching at once, leaving the rest of
+# SHEET_FETCH_CONCURRENCY to commands
+SHEET_SYNC_CONCURRENCY = 2
+# seconds between checks for the sync being turned on, while it's off
+SHEET_SYNC_IDLE_DELAY = 60
+# a sheet that keeps failing to sync waits twice as long after each failure, up to this many
+# doublings of the interval
+SHEET_SYNC_MAX_BACKOFF = 6
+
+# seconds between writes of the metrics file, if one is set
+METRICS_EXPORT_INTERVAL = 15
+
+# on load, users who used a command within this many days have their data read in ahead of time
+WARM_UP_DAYS = 7
+
+# a party's dashboard gives each member an embed field, and embeds hold 25 at most
+PARTY_MAX_SIZE = 25
+# seconds to wait after a change before editing a live dashboard, so a burst of changes is one edit
+DASHBOARD_EDIT_DELAY = 5
+
+# limit for reading a published sheet, which is a good deal smaller than this
+SHEET_MAX_BYTES = 1024 * 1024
+SHEET_CHUNK_SIZE = 8192
+
+# balance changes are written to config this often, in seconds, and journaled to this file
+# in the meantime so a crash doesn't lose them
+BALANCE_FLUSH_INTERVAL = 5
+BALANCE_JOURNAL_NAME = "balance_journal.jsonl"
+
+# each character is stored on its own, keyed by (user id, sheet id)
+CHARACTER_GROUP = "CHARACTER"
+# 1: every character in per-user characters and csettings dicts, 2: in CHARACTER_GROUP
+STORAGE_VERSION = 2
+
 # TODO: all possible default, valid, queryable skills and min/max for validation, or something
 ALL_SKILL_MINS = {
     'Accounting': 5,
@@ -149,6 +203,302 @@ DAMAGE_BUILD_CHART = {
     524: ["5d6", 6],
 }
 
+# parts of a character that a rendered sheet depends on, each with its own version
+SHEET_DATA = 0
+SHEET_BALANCES = 1
+SHEET_APPEARANCE = 2
+
+# kinds of cell reads that a sheet layout is compiled into
+FIELD = 0
+TALENT = 1
+CHARACTERISTIC = 2
+SKILL = 3
+NAMED_SKILL = 4
+
+
+class SheetLayout:
+    """Where everything lives on one version of the character sheet template.
+
+    The locations are compiled up front into one flat list of cell reads, so reading a sheet is
+    a single pass over that list.
+    """
+
+    def __init__(self, version: int, row_count: int, fields: dict, talents: list,
+        characteristics: tuple, skills: tuple, named_skill_blocks: list, block_length: int,
+        fingerprint: tuple=None):
+        self.version = version
+        self.row_count = row_count
+        # (row, col, text) of a cell that tells this version apart from the others, if needed
+        self.fingerprint = fingerprint
+
+        ops = []
+        for key, (row, col) in fields.items():
+            ops.append((FIELD, key, row, col))
+
+        for row, col in talents:
+            ops.append((TALENT, None, row, col))
+
+        row, col = characteristics
+        for i, ch in enumerate(CHARACTERISTICS):
+            ops.append((CHARACTERISTIC, ch, row + i, col))
+
+        row, col = skills
+        for i, skill in enumerate(SKILLS):
+            ops.append((SKILL, skill, row + i, col))
+
+        # blocks of a skill name with its points in the next column over
+        for row, col in named_skill_blocks:
+            for k in range(block_length):
+                ops.append((NAMED_SKILL, None, row + k, col))
+
+        self.ops = tuple(ops)
+        # named skills have their points one column over from the name
+        self.column_count = max([col + 2 if kind == NAMED_SKILL else col + 1
+            for kind, _, _, col in ops])
+
+    def matches(self, raw_data: list):
+        if len(raw_data) != self.row_count:
+            return False
+        # every row of a published sheet is as wide as the template
+        if any([len(row) < self.column_count for row in raw_data]):
+            return False
+        if self.fingerprint is None:
+            return True
+
+        row, col, text = self.fingerprint
+        return col < len(raw_data[row]) and raw_data[row][col].strip() == text
+
+    def read(self, raw_data: list):
+        char_data = {'talents': [], 'characteristics': {}, 'skills': {}}
+        talents = char_data['talents']
+        characteristics = char_data['characteristics']
+        skills = char_data['skills']
+
+        for kind, key, row, col in self.ops:
+            cells = raw_data[row]
+            if kind == SKILL:
+                skills[key] = cells[col]
+            elif kind == NAMED_SKILL:
+                if cells[col] and cells[col + 1]:
+                    skills[cells[col]] = cells[col + 1]
+            elif kind == CHARACTERISTIC:
+                characteristics[key] = cells[col]
+            elif kind == TALENT:
+                talents.append(cells[col])
+            else:
+                char_data[key] = cells[col]
+
+        return char_data
+
+
+# newest first; a layout without a fingerprint matches on row count alone, so it goes last
+SHEET_LAYOUTS = [
+    SheetLayout(
+        version=1,
+        row_count=46,
+        fields={
+            'name': (2, 1),
+            'luck': (15, 2),
+            'archetype': (2, 5),
+            'psychic_power': (10, 5),
+            'occupation_skill': (15, 5)
+        },
+        talents=[(7, 5), (8, 5)],
+        characteristics=(7, 2),
+        skills=(2, 8),
+        # specializations down two columns of four blocks, then the custom skills
+        named_skill_blocks=[(3, 10), (13, 10), (23, 10), (33, 10),
+            (3, 13), (13, 13), (23, 13), (33, 13), (3, 16)],
+        block_length=5
+    )
+]
+SHEET_MAX_ROWS = max([layout.row_count for layout in SHEET_LAYOUTS])
+SHEET_MAX_COLUMNS = max([layout.column_count for layout in SHEET_LAYOUTS])
+
+
+class SkillIndex:
+    """Everything a check name can resolve to for one character, looked up by any substring.
+
+    Targets are (where the value lives, key, label). Lookups keep the old precedence: the special
+    names, characteristics and their aliases, the character's skills in sheet order, and then the
+    umbrella skills. Everything but a character's own specializations and custom skills is the
+    same for every character, so only that part is indexed by substring, once. A character's own
+    names are just kept lowercased and scanned.
+    """
+
+    exact = {
+        'know': ('characteristics', 'edu', "Know"),
+        'idea': ('characteristics', 'int', "Idea"),
+        'luck': ('balances', 'luck', "Luck"),
+        'psych': ('skills', 'Psychology', "Psychology")
+    }
+
+    shared = None
+    umbrella = None
+
+    def __init__(self, extra_skills: dict):
+        self.extra = self.lower_names(extra_skills)
+
+    @staticmethod
+    def lower_names(extra_skills: dict):
+        """Pair each of a character's own skills with its lowercase name, in sheet order."""
+        return [(sk.lower(), sk) for sk in extra_skills.keys()]
+
+    @staticmethod
+    def index_names(names: list):
+        """Map every substring of every name to the targets it could mean, in the given order."""
+        index = {}
+        for name, target in names:
+            name = name.lower()
+            for start in range(len(name) + 1):
+                for end in range(start, len(name) + 1):
+                    targets = index.setdefault(name[start:end], [])
+                    if target not in targets:
+                        targets.append(target)
+
+        return index
+
+    def find(self, query: str):
+        """Get the target a lowercase query resolves to, or None."""
+        return self.find_in(query, self.extra)
+
+    @classmethod
+    def find_in(cls, query: str, extra: list):
+        """Get the target a lowercase query resolves to, given a character's lowercased names."""
+        if query in cls.exact:
+            return cls.exact[query]
+        if query in cls.shared:
+            return cls.shared[query][0]
+
+        for name, sk in extra:
+            if query in name:
+                return ('skills', sk, sk)
+
+        if query in cls.umbrella:
+            return cls.umbrella[query][0]
+
+        return None
+
+    def candidates(self, query: str):
+        """Get every target a lowercase query could mean, best match first."""
+        targets = [self.exact[query]] if query in self.exact else []
+        for target in self.shared.get(query, []) + \
+            [('skills', sk, sk) for name, sk in self.extra if query in name] + \
+            self.umbrella.get(query, []):
+            if target not in targets:
+                targets.append(target)
+
+        return targets
+
+
+SkillIndex.shared = SkillIndex.index_names(
+    [("sanity", ('balances', 'sanity', "Sanity")),
+        ("spellcasting", ('characteristics', 'pow', "Spellcasting"))] + \
+    [(ch, ('characteristics', ch, ch.upper())) for ch in CHARACTERISTICS] + \
+    [(alias, ('characteristics', ch, ch.upper()))
+        for alias, ch in CHARACTERISTIC_ALIASES.items()] + \
+    [(sk, ('skills', sk, sk)) for sk in SKILLS])
+SkillIndex.umbrella = SkillIndex.index_names([(sk, ('umbrella', sk, sk)) for sk in UMBRELLA_SKILLS])
+
+CHARACTERISTIC_INDEXES = {ch: i for i, ch in enumerate(CHARACTERISTICS)}
+SKILL_INDEXES = {sk: i for i, sk in enumerate(SKILLS)}
+
+
+def current_day():
+    """Get today as a day number, for noting when users were last active."""
+    return datetime.date.today().toordinal()
+
+
+class Character:
+    """A character as commands use it, with every number read off the sheet only once.
+
+    Characteristics and the default skills are ints in lists, in CHARACTERISTICS and SKILLS order.
+    Specializations and custom skills are kept apart in a small dict, in sheet order.
+    """
+
+    __slots__ = ('name', 'archetype', 'occupation_skill', 'psychic_power', 'luck', 'talents',
+        'characteristics', 'skills', 'extra_skills')
+
+    def __init__(self, name: str, archetype: str, occupation_skill: str, psychic_power: str,
+        luck: int, talents: list, characteristics: list, skills: list, extra_skills: dict):
+        self.name = name
+        self.archetype = archetype
+        self.occupation_skill = occupation_skill
+        self.psychic_power = psychic_power
+        self.luck = luck
+        self.talents = talents
+        self.characteristics = characteristics
+        self.skills = skills
+        self.extra_skills = extra_skills
+
+    @classmethod
+    def from_sheet(cls, char_data: dict):
+        """Build a character from the text read off a sheet, which should already be valid.
+
+        This is also the format characters used to be stored in.
+        """
+        skills = char_data['skills']
+        return cls(
+            name=char_data['name'],
+            archetype=char_data['archetype'],
+            occupation_skill=char_data['occupation_skill'],
+            psychic_power=char_data['psychic_power'],
+            luck=int(char_data['luck']),
+            talents=list(char_data['talents']),
+            characteristics=[int(char_data['characteristics'][ch]) for ch in CHARACTERISTICS],
+            # a named skill with a default skill's name replaced its value on the sheet
+            skills=[int(skills[sk]) for sk in SKILLS],
+            extra_skills={sk: int(value) for sk, value in skills.items()
+                if sk not in SKILL_INDEXES}
+        )
+
+    @classmethod
+    def from_config(cls, stored: dict):
+        if cls.is_legacy(stored):
+            return cls.from_sheet(stored)
+
+        return cls(
+            name=stored['name'],
+            archetype=stored['archetype'],
+            occupation_skill=stored['occupation_skill'],
+            psychic_power=stored['psychic_power'],
+            luck=stored['luck'],
+            talents=stored['talents'],
+            characteristics=stored['characteristics'],
+            skills=stored['skills'],
+            # pairs, so the sheet order survives any config backend
+            extra_skills=dict(stored['extra_skills'])
+        )
+
+    @staticmethod
+    def is_legacy(stored: dict):
+        """Check if a stored character is still the text read off the sheet."""
+        return isinstance(stored['characteristics'], dict)
+
+    def to_config(self):
+        return {
+            'name': self.name,
+            'archetype': self.archetype,
+            'occupation_skill': self.occupation_skill,
+            'psychic_power': self.psychic_power,
+            'luck': self.luck,
+            'talents': list(self.talents),
+            'characteristics': list(self.characteristics),
+            'skills': list(self.skills),
+            'extra_skills': [[sk, value] for sk, value in self.extra_skills.items()]
+        }
+
+    def characteristic(self, ch: str):
+        return self.characteristics[CHARACTERISTIC_INDEXES[ch]]
+
+    def skill(self, sk: str):
+        i = SKILL_INDEXES.get(sk)
+        return self.skills[i] if i is not None else self.extra_skills[sk]
+
+    def skill_items(self):
+        """Get every skill and its value, the default skills first."""
+        return list(zip(SKILLS, self.skills)) + list(self.extra_skills.items())
+
 
 class CthulhuCaller(commands.Cog):
     """Cog that lets users do simple things for Call of Cthulhu."""
@@ -158,164 +508,1051 @@ class CthulhuCaller(commands.Cog):
         self.bot = bot
 
         self.config = Config.get_conf(self, identifier=2020567472)
-        self.config.register_user(active_char=None, characters={}, csettings={}, preferences={})
+        self.config.register_global(connect_timeout=10.0, read_timeout=30.0, storage_version=1,
+            metrics_path=None, warm_up_days=WARM_UP_DAYS, sync_interval=0)
+        # characters and csettings are where characters used to be kept, and are only read to
+        # migrate them
+        self.config.register_user(active_char=None, names={}, preferences={}, characters={},
+            csettings={}, last_active=None)
+        # dashboard is the [channel id, message id] of a dashboard kept up to date in place
+        self.config.register_guild(party=[], dashboard=None)
+        self.config.init_custom(CHARACTER_GROUP, 2)
+        self.config.register_custom(CHARACTER_GROUP, data=None, settings={})
+
+        # user id -> snapshot of that user's own config data (the active character, the names of
+        # all of their characters, and preferences), least recently used first
+        self._user_cache = OrderedDict()
+        # (user id, sheet id) -> (Character, settings) for that character, least recently used
+        # first
+        self._characters = OrderedDict()
+        # (user id, sheet id) -> SkillIndex for that character, least recently used first
+        self._skill_indexes = OrderedDict()
+        # (user id, sheet id) -> (versions it was rendered at, sheet embed), least recently used
+        # first
+        self._sheet_embeds = OrderedDict()
+        # (user id, sheet id) -> version of each part of that character, bumped on every change
+        self._sheet_versions = {}
+
+        # changes to a character are locked by (user id, sheet id), changes to the user's own
+        # data by (user id, None), and changes to a guild's party by (None, guild id)
+        self._locks = LockManager()
+
+        # user id -> sheet id -> balances changed since they were last written to config
+        self._pending_balances = {}
+        # (user id, sheet id) of every character with a line in the journal
+        self._journaled = set()
+        self._journal_path = cog_data_path(self) / BALANCE_JOURNAL_NAME
+        self._flush_task = None
+
+        self.dice = PercentileDice()
+
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE, ttl_dns_cache=HTTP_DNS_CACHE_TTL))
+        self._fetch_semaphore = asyncio.Semaphore(SHEET_FETCH_CONCURRENCY)
+
+        self._sync_task = None
+        self._sync_semaphore = asyncio.Semaphore(SHEET_SYNC_CONCURRENCY)
+        # (user id, sheet id) -> (failed syncs in a row, time.monotonic() to try again after)
+        self._sync_failures = {}
+
+        self.metrics = Metrics()
+        self._metrics_task = None
+
+        self._warm_up_task = None
+        # ids of users written to while the warm-up is running, whose data it mustn't overwrite
+        self._written_while_warming = None
+
+        self._party = PartyIndex()
+        # guild id -> (channel id, message id) of its live dashboard
+        self._dashboards = {}
+        # guild id -> task that will edit its live dashboard
+        self._dashboard_edits = {}
+        self._parties_task = None
+
+    async def initialize(self):
+        """Move characters to their own storage if that hasn't been done yet, write back any
+        balance changes a crash kept from being flushed, then start flushing and exporting metrics.
+
+        Recently active users' data and every guild's party are read in the background, so
+        loading isn't held up by them. Sheets are synced in the background too, if turned on.
+        """
+        await self._migrate_storage()
+        await self._replay_balance_journal()
+        self._flush_task = asyncio.create_task(self._flush_balances_loop())
+        self._metrics_task = asyncio.create_task(self._export_metrics_loop())
+        self._warm_up_task = asyncio.create_task(self._warm_up())
+        self._parties_task = asyncio.create_task(self._load_parties())
+        self._sync_task = asyncio.create_task(self._sync_sheets_loop())
+
+    async def cog_unload(self):
+        for task in [self._flush_task, self._metrics_task, self._warm_up_task,
+            self._parties_task, self._sync_task] + list(self._dashboard_edits.values()):
+            if task is not None:
+                task.cancel()
+        # finished before a reloaded cog replays the journal this rewrites
+        await self._close()
+
+    async def cog_before_invoke(self, ctx):
+        # a group's hooks run before its subcommand is known, and this is started again for the
+        # subcommand
+        self.metrics.start(ctx.command.qualified_name)
+
+    async def cog_after_invoke(self, ctx):
+        # a group's hooks run before its subcommand's as well, and only the subcommand counts
+        if isinstance(ctx.command, commands.Group) and ctx.invoked_subcommand is not None:
+            return
+
+        self.metrics.finish()
+        await self._note_active(ctx.author)
+
+    async def _send(self, ctx, *args, **kwargs):
+        with self.metrics.phase("send"):
+            return await ctx.send(*args, **kwargs)
+
+    async def _close(self):
+        await self._flush_balances()
+        await self.session.close()
+
+    async def _export_metrics_loop(self):
+        while True:
+            await asyncio.sleep(METRICS_EXPORT_INTERVAL)
+            path = await self.config.metrics_path()
+            if path:
+                try:
+                    self.metrics.export(path)
+                except OSError:
+                    # tried again next time, and reported when the path is set
+                    pass
+
+    async def _warm_up(self):
+        """Fill the caches with the data and active characters of recently active users.
+
+        Every user is read in one pass, then just the active character of each recent user, so
+        their first commands after a restart don't wait on config. d20 is imported alongside.
+        """
+        loop = asyncio.get_running_loop()
+        dice_loaded = loop.run_in_executor(None, load_d20)
+
+        days = await self.config.warm_up_days()
+        if days:
+            self._written_while_warming = set()
+            try:
+                await self._warm_up_users(current_day() - days)
+            finally:
+                self._written_while_warming = None
+
+        await dice_loaded
+
+    async def _warm_up_users(self, since: int):
+        recent = [(user_id, data) for user_id, data in (await self.config.all_users()).items()
+            if (data.get('last_active') or 0) >= since]
+        # the most recent first, and no more than the cache holds
+        recent.sort(key=lambda item: item[1]['last_active'], reverse=True)
+        recent = recent[:USER_CACHE_SIZE]
+
+        active = [(user_id, data['active_char']) for user_id, data in recent
+            if data.get('active_char') is not None]
+        stored = await asyncio.gather(*[self._character_group(user_id, sheet_id).all()
+            for user_id, sheet_id in active])
+        characters = dict(zip(active, stored))
+
+        for user_id, data in recent:
+            # already read by a command, or changed since the pass, so this data is out of date
+            if user_id in self._user_cache or user_id in self._written_while_warming:
+                continue
+
+            data.pop('characters', None)
+            data.pop('csettings', None)
+            self._cache_user_data(user_id, data)
+
+            sheet_id = data.get('active_char')
+            stored = characters.get((user_id, sheet_id))
+            if stored is not None and (user_id, sheet_id) not in self._characters:
+                self._cache_stored_character(discord.Object(id=user_id), sheet_id, stored)
+
+    async def _note_active(self, user):
+        """Note the day the user last used a command, writing at most once a day."""
+        today = current_day()
+        if (await self._get_user_data(user)).get('last_active') != today:
+            await self._set_user_value(user, 'last_active', today)
+
+    async def _migrate_storage(self):
+        """Move every character out of the per-user dicts and into a group of its own.
+
+        A user's old dicts are only cleared once all of their characters have been copied over,
+        so if this is interrupted it picks up where it left off on the next load.
+        """
+        if await self.config.storage_version() >= STORAGE_VERSION:
+            return
+
+        for user_id, user_data in (await self.config.all_users()).items():
+            characters = user_data.get('characters', {})
+            if not characters:
+                continue
+
+            csettings = user_data.get('csettings', {})
+            names = dict(user_data.get('names', {}))
+            for sheet_id, stored in characters.items():
+                char = Character.from_config(stored)
+                await self._character_group(user_id, sheet_id).set({'data': char.to_config(),
+                    'settings': csettings.get(sheet_id, {})})
+                names[sheet_id] = char.name
+
+            group = self.config.user_from_id(user_id)
+            await group.names.set(names)
+            await group.characters.clear()
+            await group.csettings.clear()
+
+        await self.config.storage_version.set(STORAGE_VERSION)
 
     async def red_get_data_for_user(self, *, user_id):
         """Get a user's personal data."""
-        characters = await self.config.user_from_id(user_id).characters()
+        group = self.config.user_from_id(user_id)
+        characters = await group.names()
+        last_active = await group.last_active()
         if characters:
             data = f"For user with ID {user_id}, data is stored for characters with " + \
-                "published Google Sheet urls:\n" + \
-                "\n".join([self.make_link_from_sheet_id(g_id) for g_id in characters.keys()])
-        else:
+                "published Google Sheet urls (or hashes of the files imported from):\n" + \
+                "\n".join([g_id if is_file_sheet(g_id) else self.make_link_from_sheet_id(g_id)
+                    for g_id in characters.keys()])
+        elif last_active is None:
             data = f"No data is stored for user with ID {user_id}.\n"
-        return {"user_data.txt": BytesIO(data.encode())}
+        else:
+            data = f"For user with ID {user_id}, no characters are stored."
+        if last_active is not None:
+            data += "\nThe day a command was last used is stored: " + \
+                f"{datetime.date.fromordinal(last_active)}.\n"
+        return {"user_data.txt": io.BytesIO(data.encode())}
 
     async def red_delete_data_for_user(self, *, requester, user_id):
         """Delete a user's personal data.
 
         Imported Call of Cthulhu character data is stored by this cog.
         """
+        self._note_written(user_id)
+        # waits out any flush of these balances, so none is written back after the clear
+        for sheet_id in set(self._pending_balances.get(user_id, {})) | \
+            {sheet_id for key_user_id, sheet_id in self._journaled if key_user_id == user_id}:
+            async with self._locks.lock((user_id, sheet_id)):
+                self._drop_balances(user_id, sheet_id)
+
+        await self.config.custom(CHARACTER_GROUP, str(user_id)).clear()
         await self.config.user_from_id(user_id).clear()
+        self._party_changed(self._party.invalidate(user_id))
+        self._user_cache.pop(user_id, None)
+        for key in [key for key in self._characters.keys() if key[0] == user_id]:
+            self._characters.pop(key)
+        for key in [key for key in self._skill_indexes.keys() if key[0] == user_id]:
+            self._skill_indexes.pop(key)
+        for key in [key for key in set(self._sheet_embeds) | set(self._sheet_versions)
+            if key[0] == user_id]:
+            self._forget_sheet(key)
+
+    async def _get_user_data(self, user):
+        """Get a snapshot of the user's own data, only reading config on a cache miss."""
+        data = self._user_cache.get(user.id)
+        if data is None:
+            self.metrics.miss("users")
+            with self.metrics.phase("config_read"):
+                data = await self.config.user(user).all()
+            # already migrated
+            data.pop('characters', None)
+            data.pop('csettings', None)
+
+            self._cache_user_data(user.id, data)
+        else:
+            self.metrics.hit("users")
+            self._user_cache.move_to_end(user.id)
 
-    @commands.command(name="import")
-    async def import_char(self, ctx, url: str):
-        """Import from the Google Sheet template."""
-        if not re.match(GSHEET_URL_TEMPLATE, url):
-            await ctx.send("Couldn't parse that as a link to an expected Google Sheet.\n" + \
-                "Please check that the sheet uses the importable template, and was published " + \
-                "as the first tab (Sheet) only and as a csv file.")
+        return data
+
+    def _cache_user_data(self, user_id: int, data: dict):
+        self._user_cache[user_id] = data
+        self._user_cache.move_to_end(user_id)
+        if len(self._user_cache) > USER_CACHE_SIZE:
+            self._user_cache.popitem(last=False)
+
+    async def _set_user_value(self, user, key: str, value):
+        """Write a value to config, keeping the user's cached snapshot in step."""
+        self._note_written(user.id)
+        with self.metrics.phase("config_write"):
+            await self.config.user(user).set_raw(key, value=value)
+        if user.id in self._user_cache:
+            self._user_cache[user.id][key] = value
+
+        if key == 'active_char':
+            self._party_changed(self._party.invalidate(user.id))
+
+    def _note_written(self, user_id: int):
+        """Keep the warm-up, if it's running, from caching this user's data over newer changes."""
+        if self._written_while_warming is not None:
+            self._written_while_warming.add(user_id)
+
+    def _character_group(self, user_id: int, sheet_id: str):
+        return self.config.custom(CHARACTER_GROUP, str(user_id), sheet_id)
+
+    async def _get_character(self, user, sheet_id: str):
+        """Get one of the user's characters and its settings, only reading config on a cache miss.
+
+        Returns None for both if there's no such character.
+        """
+        key = (user.id, sheet_id)
+        cached = self._characters.get(key)
+        if cached is not None:
+            self.metrics.hit("characters")
+            self._characters.move_to_end(key)
+            return cached
+
+        self.metrics.miss("characters")
+        with self.metrics.phase("config_read"):
+            stored = await self._character_group(user.id, sheet_id).all()
+        return self._cache_stored_character(user, sheet_id, stored)
+
+    def _cache_stored_character(self, user, sheet_id: str, stored: dict):
+        """Cache a character as read from config, returning it and its settings (None for both
+        if there's no such character)."""
+        if stored['data'] is None:
+            return None, None
+
+        settings = stored['settings']
+        # config doesn't have these yet
+        balances = self._pending_balances.get(user.id, {}).get(sheet_id)
+        if balances is not None:
+            settings['balances'] = balances
+
+        return self._cache_character(user, sheet_id, Character.from_config(stored['data']),
+            settings)
+
+    def _cache_character(self, user, sheet_id: str, char: Character, settings: dict):
+        key = (user.id, sheet_id)
+        self._characters[key] = (char, settings)
+        self._characters.move_to_end(key)
+        if len(self._characters) > CHARACTER_CACHE_SIZE:
+            self._characters.popitem(last=False)
+
+        return char, settings
+
+    async def _set_character(self, user, sheet_id: str, char: Character, settings: dict):
+        """Write a character and its settings to config, keeping the cache in step."""
+        self._note_written(user.id)
+        with self.metrics.phase("config_write"):
+            await self._character_group(user.id, sheet_id).set({'data': char.to_config(),
+                'settings': settings})
+        self._cache_character(user, sheet_id, char, settings)
+
+    async def _set_character_data(self, user, sheet_id: str, char: Character):
+        """Write a character, but not its settings, to config, keeping the cache in step."""
+        self._note_written(user.id)
+        with self.metrics.phase("config_write"):
+            await self._character_group(user.id, sheet_id).set_raw('data', value=char.to_config())
+        cached = self._characters.get((user.id, sheet_id))
+        if cached is not None:
+            self._cache_character(user, sheet_id, char, cached[1])
+
+    async def _set_character_setting(self, user, sheet_id: str, key: str, value):
+        """Write one of a character's settings to config, keeping the cache in step."""
+        self._note_written(user.id)
+        with self.metrics.phase("config_write"):
+            await self._character_group(user.id, sheet_id).set_raw('settings', key, value=value)
+        cached = self._characters.get((user.id, sheet_id))
+        if cached is not None:
+            cached[1][key] = value
+
+    def _get_skill_index(self, user, sheet_id: str, char: Character):
+        """Get the character's skill index, building it if it isn't cached."""
+        key = (user.id, sheet_id)
+        index = self._skill_indexes.get(key)
+        if index is None:
+            self.metrics.miss("skill_indexes")
+            index = self._cache_skill_index(user, sheet_id, char)
+        else:
+            self.metrics.hit("skill_indexes")
+            self._skill_indexes.move_to_end(key)
+
+        return index
+
+    def _cache_skill_index(self, user, sheet_id: str, char: Character):
+        index = SkillIndex(char.extra_skills)
+        self._skill_indexes[(user.id, sheet_id)] = index
+        self._skill_indexes.move_to_end((user.id, sheet_id))
+        if len(self._skill_indexes) > SKILL_INDEX_CACHE_SIZE:
+            self._skill_indexes.popitem(last=False)
+
+        return index
+
+    def _journal_balances(self, user, sheet_id: str, balances: dict):
+        """Change a character's balances without writing them to config straight away.
+
+        The change is journaled, and queued so that the next flush writes only the latest
+        balances of each changed character.
+        """
+        self._note_written(user.id)
+        self._append_to_journal(user.id, sheet_id, balances)
+        self._pending_balances.setdefault(user.id, {})[sheet_id] = balances
+        self._party_changed(self._party.update(user.id, sheet_id, balances=balances))
+
+    def _note_balances_written(self, user, sheet_id: str, balances: dict):
+        """Keep an older journal line from undoing balances just written to config some other way.
+        """
+        if (user.id, sheet_id) in self._journaled:
+            self._append_to_journal(user.id, sheet_id, balances)
+
+    def _drop_balances(self, user_id: int, sheet_id: str):
+        """Forget any balance changes for a character that's going away."""
+        sheets = self._pending_balances.get(user_id, {})
+        sheets.pop(sheet_id, None)
+        if not sheets:
+            self._pending_balances.pop(user_id, None)
+        if (user_id, sheet_id) in self._journaled:
+            self._append_to_journal(user_id, sheet_id, None)
+
+    def _append_to_journal(self, user_id: int, sheet_id: str, balances: dict):
+        with self._journal_path.open("a") as journal:
+            journal.write(json.dumps({'user': user_id, 'sheet': sheet_id, 'balances': balances}) + \
+                "\n")
+        self._journaled.add((user_id, sheet_id))
+
+    async def _flush_balances_loop(self):
+        while True:
+            await asyncio.sleep(BALANCE_FLUSH_INTERVAL)
+            await self._flush_balances()
+
+    async def _flush_balances(self):
+        """Write every character's pending balances to config, one write each."""
+        for user_id in list(self._pending_balances.keys()):
+            for sheet_id in list(self._pending_balances.get(user_id, {}).keys()):
+                async with self._locks.lock((user_id, sheet_id)):
+                    await self._flush_character_balances(user_id, sheet_id)
+
+        # only what's still pending needs to stay journaled
+        with self._journal_path.open("w") as journal:
+            for user_id, sheets in self._pending_balances.items():
+                for sheet_id, balances in sheets.items():
+                    journal.write(json.dumps({'user': user_id, 'sheet': sheet_id,
+                        'balances': balances}) + "\n")
+        self._journaled = {(user_id, sheet_id) for user_id, sheets in
+            self._pending_balances.items() for sheet_id in sheets.keys()}
+
+    async def _flush_character_balances(self, user_id: int, sheet_id: str):
+        """Write one character's pending balances to config, under the character's lock."""
+        # the character may have been removed, or the user's data deleted, while waiting
+        balances = self._pending_balances.get(user_id, {}).get(sheet_id)
+        if balances is None:
+            return
+        group = self._character_group(user_id, sheet_id)
+        if (user_id, sheet_id) not in self._characters and await group.data() is None:
+            self._drop_balances(user_id, sheet_id)
             return
 
-        sheet_id = self._get_sheet_identifier_from_url(url)
+        version = self._get_sheet_version(user_id, sheet_id, SHEET_BALANCES)
+        written = dict(balances)
+        self._note_written(user_id)
+        try:
+            with self.metrics.phase("config_write"):
+                await group.set_raw('settings', 'balances', value=written)
+        except Exception:
+            # still pending, so it's tried again next time
+            return
 
-        async with self.config.user(ctx.author).characters() as characters:
-            if sheet_id in characters:
-                active_char = await self.config.user(ctx.author).active_char()
-                if sheet_id != active_char:
-                    await ctx.send("This sheet has already been imported, but is not currently " + \
-                        "active.")
-                else:
-                    await ctx.send("This sheet has already been imported and is currently active.")
-                return
+        # anything changed while writing has to wait for the next flush
+        sheets = self._pending_balances.get(user_id, {})
+        if sheets.get(sheet_id) is balances and \
+            self._get_sheet_version(user_id, sheet_id, SHEET_BALANCES) == version:
+            sheets.pop(sheet_id)
+            if not sheets:
+                self._pending_balances.pop(user_id, None)
 
-        await self.bot.wait_until_ready()
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                reader = csv.reader(io.StringIO(await response.text()), delimiter=',')
-
-        raw_data = list(reader)
-        if not self._is_char_csv_data(raw_data):
-            await ctx.send("Couldn't find character data at this link. Is the sheet still " + \
-                "being published to web?")
+    async def _replay_balance_journal(self):
+        if not self._journal_path.exists():
             return
 
-        char_data = self.read_char_data(raw_data)
+        latest = {}
+        with self._journal_path.open() as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # cut off partway through by the crash
+                    continue
+                latest[(entry['user'], entry['sheet'])] = entry['balances']
+
+        for (user_id, sheet_id), balances in latest.items():
+            group = self._character_group(user_id, sheet_id)
+            # the character was removed, or the user's data deleted, since
+            if balances is None or await group.data() is None:
+                continue
+            await group.set_raw('settings', 'balances', value=balances)
+
+        self._journal_path.unlink()
+        self._journaled.clear()
+
+    def _bump_sheet_version(self, user, sheet_id: str, *parts: int):
+        """Note that parts of a character have changed, so its rendered sheet is out of date."""
+        versions = self._sheet_versions.setdefault((user.id, sheet_id), [0, 0, 0])
+        for part in parts:
+            versions[part] += 1
+
+    def _get_sheet_version(self, user_id: int, sheet_id: str, part: int):
+        return self._sheet_versions.get((user_id, sheet_id), [0, 0, 0])[part]
+
+    def _get_sheet_embed(self, user, sheet_id: str):
+        """Get a copy of the character's rendered sheet, or None if it's missing or out of date."""
+        key = (user.id, sheet_id)
+        cached = self._sheet_embeds.get(key)
+        if cached is None or cached[0] != tuple(self._sheet_versions.get(key, [0, 0, 0])):
+            self.metrics.miss("sheet_embeds")
+            return None
+
+        self.metrics.hit("sheet_embeds")
+        self._sheet_embeds.move_to_end(key)
+        return cached[1].copy()
+
+    def _cache_sheet_embed(self, user, sheet_id: str, embed):
+        key = (user.id, sheet_id)
+        self._sheet_embeds[key] = (tuple(self._sheet_versions.get(key, [0, 0, 0])), embed.copy())
+        self._sheet_embeds.move_to_end(key)
+        if len(self._sheet_embeds) > SHEET_EMBED_CACHE_SIZE:
+            self._sheet_embeds.popitem(last=False)
+
+    def _forget_sheet(self, key: tuple):
+        self._sheet_embeds.pop(key, None)
+        self._sheet_versions.pop(key, None)
 
-        is_valid, errors = self._is_char_data_valid(char_data)
-        if not is_valid:
-            await ctx.send(f"Something was wrong with this sheet: {'; '.join(errors)}.\n" + \
-                "Please check that every cell is in the right place and filled in correctly. " + \
-                "Aborting import.")
+    @commands.command(name="import")
+    async def import_char(self, ctx, *urls: str):
+        """Import from the Google Sheet template.
+
+        Takes one or more links to published Google Sheets as argument, and/or attached csv or
+        xlsx files exported from the sheet.
+        """
+        attachments = ctx.message.attachments
+        if not urls and not attachments:
+            await ctx.send_help()
             return
 
-        async with self.config.user(ctx.author).characters() as characters:
-            characters[sheet_id] = char_data
+        data = await self._get_user_data(ctx.author)
+
+        # no need to say which link or file a lone message is about
+        many = len(urls) + len(attachments) > 1
+        labels = {url: f"<{url}>: " if many else "" for url in urls}
+
+        lines = []
+        to_load = {}
+        for url in urls:
+            label = labels[url]
+            if not re.match(GSHEET_URL_TEMPLATE, url):
+                lines.append(f"{label}Couldn't parse that as a link to an expected Google " + \
+                    "Sheet.\nPlease check that the sheet uses the importable template, and was " + \
+                    "published as the first tab (Sheet) only and as a csv file.")
+                continue
+
+            sheet_id = self._get_sheet_identifier_from_url(url)
+            if sheet_id in data['names']:
+                lines.append(f"{label}{self._get_already_imported_text(data, sheet_id)}")
+                continue
+
+            to_load[sheet_id] = url
+
+        # (sheet id, label, character, source, error) of everything read
+        loaded = []
+        for attachment in attachments:
+            label = f"{attachment.filename}: " if many else ""
+            rows, source, error = await self._read_attachment(attachment)
+            if error:
+                lines.append(f"{label}{error}")
+                continue
+
+            sheet_id = file_sheet_id(source['digest'])
+            if sheet_id in data['names']:
+                lines.append(f"{label}{self._get_already_imported_text(data, sheet_id)}")
+                continue
+
+            char, error = self._read_sheet(rows)
+            loaded.append((sheet_id, label, char, source, error or "Couldn't find character " + \
+                "data in this file. Is it exported from the importable template?"))
+
+        await self.bot.wait_until_ready()
+        results = await asyncio.gather(*[self._load_sheet(url) for url in to_load.values()])
+        loaded = [(sheet_id, labels[url], *result) for (sheet_id, url), result in
+            zip(to_load.items(), results)] + loaded
+
+        imported = {}
+        for sheet_id, label, char, source, error in loaded:
+            if char is None:
+                lines.append(f"{label}{error}")
+                continue
+
+            async with self._locks.lock((ctx.author.id, sheet_id)):
+                # the same sheet could have been imported while this one was being fetched
+                if (await self._get_character(ctx.author, sheet_id))[0] is not None or \
+                    sheet_id in imported:
+                    lines.append(f"{label}This sheet has already been imported.")
+                    continue
+
+                settings = {'balances': self._get_starting_balances(char), 'source': source}
+                await self._set_character(ctx.author, sheet_id, char, settings)
+                self._cache_skill_index(ctx.author, sheet_id, char)
+                self._bump_sheet_version(ctx.author, sheet_id, SHEET_DATA, SHEET_BALANCES,
+                    SHEET_APPEARANCE)
+            imported[sheet_id] = char.name
+
+            lines.append(f"Successfully imported data for {char.name}.")
+
+        if imported:
+            await self._set_names(ctx.author, imported)
+            await self._set_user_value(ctx.author, 'active_char', list(imported.keys())[-1])
+
+        await self._send(ctx, "\n".join(lines))
+
+    def _get_already_imported_text(self, data: dict, sheet_id: str):
+        if sheet_id != data['active_char']:
+            return "This sheet has already been imported, but is not currently active."
+        return "This sheet has already been imported and is currently active."
+
+    async def _read_attachment(self, attachment, cached_source: dict=None):
+        """Read the rows of an attached csv or xlsx export of a sheet.
+
+        Returns the rows, the source (a digest of the file), and an error message if it couldn't
+        be read. The rows are None if the file is the same one the cached source was made from,
+        so it isn't read again.
+        """
+        filename = attachment.filename.lower()
+        if not filename.endswith((".csv", ".xlsx")):
+            return None, None, "Only csv and xlsx files can be imported."
+        if attachment.size > SHEET_MAX_BYTES:
+            return None, None, "This file is too big to be a character sheet."
 
-        await self.config.user(ctx.author).active_char.set(sheet_id)
+        try:
+            file_data = await attachment.read()
+        except discord.HTTPException:
+            return None, None, "Couldn't download this file. Please try again in a little while."
 
-        balances = self._get_starting_balances(char_data)
-        async with self.config.user(ctx.author).csettings() as csettings:
-            csettings[sheet_id] = {}
-            csettings[sheet_id]['balances'] = balances
+        source = {'digest': file_digest(file_data)}
+        if cached_source and cached_source.get('digest') == source['digest']:
+            return None, source, None
 
-        await ctx.send(f"Successfully imported data for {char_data['name']}.")
+        with self.metrics.phase("csv_parse"):
+            if filename.endswith(".csv"):
+                rows = read_csv_rows(file_data, SHEET_MAX_ROWS, SHEET_MAX_COLUMNS)
+            else:
+                try:
+                    # openpyxl works through the file in one go, so it's kept off the event loop
+                    rows = await asyncio.get_running_loop().run_in_executor(None, read_xlsx_rows,
+                        file_data, SHEET_MAX_ROWS, SHEET_MAX_COLUMNS)
+                except ImportError:
+                    return None, None, "Reading xlsx files isn't set up on this bot. Please " + \
+                        "export the sheet as a csv file instead."
+                except FileTooBig:
+                    return None, None, "This file is too big to be a character sheet."
+                except Exception:
+                    return None, None, "Couldn't read this file as a spreadsheet."
+
+        return rows, source, None
+
+    async def _load_attachment(self, attachment, cached_source: dict=None):
+        """Read and validate an attached sheet, like _load_sheet does for a link."""
+        rows, source, error = await self._read_attachment(attachment, cached_source)
+        if rows is None:
+            return None, source, error
+
+        char, error = self._read_sheet(rows)
+        if char is None:
+            return None, None, error or "Couldn't find character data in this file. Is it " + \
+                "exported from the importable template?"
+
+        return char, source, None
+
+    async def _set_names(self, user, changed: dict):
+        """Add, rename or (with a name of None) drop characters in the user's names."""
+        async with self._locks.lock((user.id, None)):
+            names = dict((await self._get_user_data(user))['names'])
+            for sheet_id, name in changed.items():
+                if name is None:
+                    names.pop(sheet_id, None)
+                else:
+                    names[sheet_id] = name
+            await self._set_user_value(user, 'names', names)
 
     @commands.command()
     async def update(self, ctx, url: str=""):
         """Update character data.
-        
-        Optionally takes a link to a published Google Sheet as argument.
+
+        Optionally takes a link to a published Google Sheet as argument, or "all" to update
+        every imported character at once. With an attached csv or xlsx export of the sheet
+        instead, updates the active character from that.
         """
-        active_sheet_id = await self.config.user(ctx.author).active_char()
-        if not url:
+        data = await self._get_user_data(ctx.author)
+        active_sheet_id = data['active_char']
+        attachments = ctx.message.attachments
+        if not url and attachments:
+            if active_sheet_id is None:
+                await self._send(ctx, "Tried to update active character but no character is " + \
+                    "active.")
+                return
+
+            lines = await self._update_characters(ctx.author, [active_sheet_id], attachments[0])
+            await self._send(ctx, lines[0])
+            return
+        elif url.lower() == "all":
+            if not data['names']:
+                await self._send(ctx, "You have no characters.")
+                return
+
+            lines = await self._update_characters(ctx.author, list(data['names'].keys()))
+            await self._send(ctx, "\n".join(sorted(lines)))
+            return
+        elif not url:
             sheet_id = active_sheet_id
             if sheet_id is None:
-                await ctx.send("Tried to update active character but no character is active.")
+                await self._send(ctx, "Tried to update active character but no character is " + \
+                    "active.")
                 return
-
-            char_url = self.make_link_from_sheet_id(sheet_id)
         else:
             if not re.match(GSHEET_URL_TEMPLATE, url):
-                await ctx.send("Couldn't parse that as a link to an expected Google Sheet.\n" + \
-                    "Please check that the sheet uses the importable template, and was " + \
-                    "published as the first tab (Sheet) only and as a csv file.")
+                await self._send(ctx, "Couldn't parse that as a link to an expected Google " + \
+                    "Sheet.\nPlease check that the sheet uses the importable template, and " + \
+                    "was published as the first tab (Sheet) only and as a csv file.")
                 return
             sheet_id = self._get_sheet_identifier_from_url(url)
-            char_url = url
 
-            characters = await self.config.user(ctx.author).characters()
-            if sheet_id not in characters.keys():
-                await ctx.send("This character was not recognized, `import` them instead.")
+            if sheet_id not in data['names'].keys():
+                await self._send(ctx, "This character was not recognized, `import` them instead.")
                 return
             else:
                 if sheet_id != active_sheet_id:
-                    await ctx.send("Making this character active and updating.")
-                await self.config.user(ctx.author).active_char.set(sheet_id)
+                    await self._send(ctx, "Making this character active and updating.")
+                await self._set_user_value(ctx.author, 'active_char', sheet_id)
+
+        lines = await self._update_characters(ctx.author, [sheet_id])
+        await self._send(ctx, lines[0])
 
+    async def _update_characters(self, user, sheet_ids: list, attachment=None):
+        """Refetch the given characters all at once, only writing the ones that changed. Given
+        an attached file, the one character is read from that instead.
+
+        Each character is only locked once its sheet has been fetched, so other commands can use
+        it in the meantime. Returns one line of results per character.
+        """
+        current = [await self._get_character(user, sheet_id) for sheet_id in sheet_ids]
+
+        if attachment is not None:
+            results = [await self._load_attachment(attachment, current[0][1].get('source'))]
+        else:
+            await self.bot.wait_until_ready()
+            results = await asyncio.gather(*[self._reload_sheet(sheet_id, settings)
+                for sheet_id, (_, settings) in zip(sheet_ids, current)])
+
+        return await self._save_updates(user, sheet_ids, [char.name for char, _ in current],
+            results)
+
+    async def _save_updates(self, user, sheet_ids: list, names: list, results: list):
+        """Write the characters loaded for an update, keeping their balances within any new
+        maximums. Characters whose sheets didn't change (with a Character of None) aren't written,
+        and of the rest only what changed is.
+
+        Returns one line of results per character.
+        """
+        renamed = {}
+        lines = []
+        for sheet_id, name, (char, source, error) in zip(sheet_ids, names, results):
+            if error:
+                lines.append(f"{name}: {error}" if len(sheet_ids) > 1 else error)
+                continue
+            elif char is None:
+                # the sheet hasn't changed since the last import or update, though it may have
+                # come with new validators
+                await self._save_source(user, sheet_id, source)
+                lines.append(f"No changes found for {name}.")
+                continue
+
+            async with self._locks.lock((user.id, sheet_id)):
+                # balances may have changed while fetching, so only now are they read
+                old_char, settings = await self._get_character(user, sheet_id)
+                if settings is None:
+                    lines.append(f"{name} was removed before the update finished.")
+                    continue
+
+                # the sheet can change in places that aren't read, like its notes
+                data_changed = char.to_config() != old_char.to_config()
+                if data_changed:
+                    await self._set_character_data(user, sheet_id, char)
+                    self._cache_skill_index(user, sheet_id, char)
+                    self._bump_sheet_version(user, sheet_id, SHEET_DATA)
+
+                # balances should stay the same unless max values were changed by this update
+                old_balances = dict(settings['balances'])
+                balance_updates = self._reconcile_balances(settings['balances'], char)
+                balances_changed = settings['balances'] != old_balances
+                if balances_changed:
+                    self._note_balances_written(user, sheet_id, settings['balances'])
+                    await self._set_character_setting(user, sheet_id, 'balances',
+                        settings['balances'])
+                    self._bump_sheet_version(user, sheet_id, SHEET_BALANCES)
+
+                # kept even if nothing else changed, so the same sheet isn't read again
+                await self._set_character_setting(user, sheet_id, 'source', source)
+
+                if data_changed or balances_changed:
+                    self._party_changed(self._party.update(user.id, sheet_id, char.name,
+                        settings['balances']))
+            if not data_changed:
+                lines.append(f"No changes found for {name}.")
+                continue
+            elif char.name != name:
+                renamed[sheet_id] = char.name
+
+            balance_update_text = f"\n{' '.join(balance_updates)}" if len(balance_updates) \
+                else ""
+            lines.append(f"Updated data for {char.name}.{balance_update_text}")
+
+        if renamed:
+            await self._set_names(user, renamed)
+
+        return lines
+
+    async def _save_source(self, user, sheet_id: str, source: dict):
+        """Keep the validators a sheet was last fetched with, if they're new."""
+        async with self._locks.lock((user.id, sheet_id)):
+            _, settings = await self._get_character(user, sheet_id)
+            if settings is not None and source is not None and settings.get('source') != source:
+                await self._set_character_setting(user, sheet_id, 'source', source)
+
+    async def _reload_sheet(self, sheet_id: str, settings: dict):
+        if is_file_sheet(sheet_id):
+            return None, None, "This character was imported from a file, so can only be " + \
+                "updated by attaching a newer export of it."
+
+        return await self._load_sheet(self.make_link_from_sheet_id(sheet_id),
+            settings.get('source'))
+
+    async def _sync_sheets_loop(self):
+        """Keep refetching every character imported from a link, if turned on.
+
+        Each round, every sheet is synced once at a random point within the interval, so the
+        fetches are spread out rather than all made at once.
+        """
         await self.bot.wait_until_ready()
-        async with aiohttp.ClientSession() as session:
-            async with session.get(char_url) as response:
-                reader = csv.reader(io.StringIO(await response.text()), delimiter=',')
-
-        raw_data = list(reader)
-        if not self._is_char_csv_data(raw_data):
-            await ctx.send("Couldn't find character data at this link. Is the sheet still " + \
-                "being published to web?")
+        while True:
+            interval = await self.config.sync_interval() * 60
+            if not interval:
+                await asyncio.sleep(SHEET_SYNC_IDLE_DELAY)
+                continue
+
+            sheets = []
+            failures = {}
+            now = time.monotonic()
+            for user_id, data in (await self.config.all_users()).items():
+                for sheet_id, name in data['names'].items():
+                    if is_file_sheet(sheet_id):
+                        continue
+
+                    # characters removed since they failed are dropped here
+                    key = (user_id, sheet_id)
+                    if key in self._sync_failures:
+                        failures[key] = self._sync_failures[key]
+                    if failures.get(key, (0, 0))[1] <= now:
+                        sheets.append((user_id, sheet_id, name))
+            self._sync_failures = failures
+
+            await asyncio.gather(asyncio.sleep(interval), *[self._sync_sheet(user_id, sheet_id,
+                name, random.uniform(0, interval)) for user_id, sheet_id, name in sheets])
+
+    async def _sync_sheet(self, user_id: int, sheet_id: str, name: str, delay: float):
+        """Refetch a character after a delay, saving it like update does if it has changed.
+
+        A sheet that fails is left alone for longer after each failure.
+        """
+        await asyncio.sleep(delay)
+        key = (user_id, sheet_id)
+        try:
+            synced = await self._resync_sheet(user_id, sheet_id, name)
+        except Exception:
+            log.exception(f"Couldn't sync sheet {sheet_id} of user {user_id}")
+            synced = False
+
+        if synced:
+            self._sync_failures.pop(key, None)
             return
 
-        char_data = self.read_char_data(raw_data)
+        failures = self._sync_failures.get(key, (0, 0))[0] + 1
+        interval = await self.config.sync_interval() * 60
+        self._sync_failures[key] = (failures, time.monotonic() + interval * \
+            2 ** min(failures, SHEET_SYNC_MAX_BACKOFF))
 
-        is_valid, errors = self._is_char_data_valid(char_data)
-        if not is_valid:
-            await ctx.send(f"Something was wrong with this sheet: {'; '.join(errors)}.\n" + \
-                "Please check that every cell is in the right place and filled in correctly. " + \
-                "Aborting update.")
-            return
+    async def _resync_sheet(self, user_id: int, sheet_id: str, name: str):
+        """Refetch a character, saving it if it has changed. Returns whether it could be fetched.
+        """
+        key = (user_id, sheet_id)
+        async with self._sync_semaphore:
+            cached = self._characters.get(key)
+            if cached is not None:
+                source = cached[1].get('source')
+            else:
+                with self.metrics.phase("config_read"):
+                    source = await self._character_group(user_id, sheet_id).get_raw('settings',
+                        'source', default=None)
+            result = await self._load_sheet(self.make_link_from_sheet_id(sheet_id), source)
 
-        async with self.config.user(ctx.author).characters() as characters:
-            characters[sheet_id] = char_data
+        char, new_source, error = result
+        if error:
+            return False
 
-        await self.config.user(ctx.author).active_char.set(sheet_id)
+        # only a changed sheet, or new validators for it, needs saving
+        if char is not None or new_source != source:
+            await self._save_updates(discord.Object(id=user_id), [sheet_id], [name], [result])
+        return True
 
-        # balances should stay the same unless max values were changed by this update
-        # patch_notes = []
+    def _reconcile_balances(self, balances: dict, char: Character):
+        """Cap balances to the maximums from new character data, noting anything reduced."""
         balance_updates = []
-        async with self.config.user(ctx.author).csettings() as settings:
-            balances = settings[sheet_id]['balances']
-            new_balances = self._get_starting_balances(char_data)
+        new_balances = self._get_starting_balances(char)
+
+        balances['magic_maximum'] = new_balances['magic_maximum']
+        balances['health_maximum'] = new_balances['health_maximum']
+
+        if new_balances['magic_maximum'] < balances['magic']:
+            balance_updates.append(f"Magic was {balances['magic']} and has been reduced " + \
+                f"to the new maximum of {new_balances['magic_maximum']}.")
+            balances['magic'] = new_balances['magic_maximum']
 
-            balances['magic_maximum'] = new_balances['magic_maximum']
-            balances['health_maximum'] = new_balances['health_maximum']
+        if new_balances['health_maximum'] < balances['health']:
+            balance_updates.append(f"Health was {balances['health']} and has been reduced " + \
+                f"to the new maximum of {new_balances['health_maximum']}.")
+            balances['health'] = new_balances['health_maximum']
 
-            if new_balances['magic_maximum'] < balances['magic']:
-                balance_updates.append(f"Magic was {balances['magic']} and has been reduced " + \
-                    f"to the new maximum of {new_balances['magic_maximum']}.")
-                balances['magic'] = new_balances['magic_maximum']
+        new_sanity_max = 99 - char.skill('Cthulhu Mythos')
+        if balances['sanity'] > new_sanity_max:
+            balance_updates.append(f"Sanity was {balances['sanity']} and has been reduced " + \
+                f"to the new maximum of {new_sanity_max}.")
+            balances['sanity'] = new_sanity_max
 
-            if new_balances['health_maximum'] < balances['health']:
-                balance_updates.append(f"Health was {balances['health']} and has been reduced " + \
-                    f"to the new maximum of {new_balances['health_maximum']}.")
+        return balance_updates
 
-            new_sanity_max = 99 - int(char_data['skills']['Cthulhu Mythos'])
-            if balances['sanity'] > new_sanity_max:
-                balance_updates.append(f"Sanity was {balances['sanity']} and has been reduced " + \
-                    f"to the new maximum of {new_sanity_max}.")
-                balances['sanity'] = new_sanity_max
+    async def _load_sheet(self, url: str, cached_source: dict=None):
+        """Fetch, read and validate a sheet, a few at a time across the whole cog.
 
-        balance_update_text = f"\n{' '.join(balance_updates)}" if len(balance_updates) else ""
+        Returns the Character (None if the sheet is unchanged), the new validators, and an
+        error message if the sheet couldn't be loaded.
+        """
+        async with self._fetch_semaphore:
+            try:
+                with self.metrics.phase("http_fetch"):
+                    raw_data, source = await self._fetch_sheet(url, cached_source)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return None, None, "Couldn't reach this link. Please try again in a little while."
+
+        if raw_data is None:
+            return None, source, None
+
+        char, error = self._read_sheet(raw_data)
+        if char is None:
+            return None, None, error or "Couldn't find character data at this link. Is the " + \
+                "sheet still being published to web?"
+
+        return char, source, None
+
+    def _read_sheet(self, raw_data: list):
+        """Read and validate a sheet's rows.
+
+        Returns the Character, or an error message if the sheet was wrong. Both are None if the
+        rows aren't a character sheet at all.
+        """
+        with self.metrics.phase("csv_parse"):
+            if not self._is_char_csv_data(raw_data):
+                return None, None
+
+            char_data = self.read_char_data(raw_data)
+
+        with self.metrics.phase("validation"):
+            is_valid, errors = self._is_char_data_valid(char_data)
+        if not is_valid:
+            return None, f"Something was wrong with this sheet: {'; '.join(errors)}.\n" + \
+                "Please check that every cell is in the right place and filled in correctly."
+
+        return Character.from_sheet(char_data), None
+
+    async def _fetch_sheet(self, url: str, cached_source: dict=None):
+        """Fetch and read a published sheet.
 
-        await ctx.send(f"Updated data for {char_data['name']}.{balance_update_text}")
+        Sends the validators from the last fetch, if any, so an unchanged sheet comes back as
+        None instead of being downloaded again. A sheet downloaded with the same contents as last
+        time is also None, so it isn't read again. Returns the rows and the new validators.
+        """
+        headers = {}
+        if cached_source:
+            if cached_source.get('etag'):
+                headers['If-None-Match'] = cached_source['etag']
+            if cached_source.get('last_modified'):
+                headers['If-Modified-Since'] = cached_source['last_modified']
+
+        with self.metrics.phase("config_read"):
+            timeout = aiohttp.ClientTimeout(sock_connect=await self.config.connect_timeout(),
+                sock_read=await self.config.read_timeout())
+
+        async with self.session.get(url, headers=headers, timeout=timeout) as response:
+            if response.status == 304:
+                return None, cached_source
+
+            raw_data, digest = await self._read_csv_rows(response)
+            source = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'digest': digest
+            }
+
+        # republished without any changes, or sent without validators
+        if digest is not None and cached_source and cached_source.get('digest') == digest:
+            return None, source
+
+        return raw_data, source
+
+    async def _read_csv_rows(self, response):
+        """Read csv rows from a response as it arrives, along with a digest of the whole body.
+
+        Gives up early once the body clearly isn't a sheet (an html page, too many bytes, or more
+        rows than the template has), so only a sheet's worth of data is ever held at once. The
+        digest is None then.
+        """
+        decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+        digest = hashlib.sha256()
+        rows = []
+        pending = ""
+        record = []
+        quotes = 0
+        size = 0
+
+        async for chunk in response.content.iter_chunked(SHEET_CHUNK_SIZE):
+            if not size and b"!DOCTYPE html" in chunk:
+                return [], None
+            size += len(chunk)
+            if size > SHEET_MAX_BYTES:
+                return [], None
+            digest.update(chunk)
+
+            # only whole lines are parsed, the rest waits for the next chunk
+            lines = (pending + decoder.decode(chunk)).split("\n")
+            pending = lines.pop()
+
+            for line in lines:
+                record.append(line + "\n")
+                # an odd number of quotes means a quoted cell carries on to the next line
+                quotes += line.count('"')
+                if quotes % 2:
+                    continue
+                rows.extend(csv.reader(record, delimiter=','))
+                record = []
+                quotes = 0
+
+                if len(rows) > SHEET_MAX_ROWS:
+                    return rows, None
+
+        pending += decoder.decode(b"", final=True)
+        if pending:
+            record.append(pending)
+        if record:
+            rows.extend(csv.reader(record, delimiter=','))
+
+        return rows, digest.hexdigest()
 
     def _get_sheet_identifier_from_url(self, url: str):
         start_index = url.find('/d/e/') + 5
@@ -325,51 +1562,18 @@ class CthulhuCaller(commands.Cog):
 
     def _is_char_csv_data(self, raw_data: list):
         # TODO: think of other validations
-        return len(raw_data) == 46 and "!DOCTYPE html" not in raw_data[0]
+        return self._get_sheet_layout(raw_data) is not None and \
+            "!DOCTYPE html" not in raw_data[0]
 
-    def read_char_data(self, raw_data: list):
-        char_data = {}
-
-        # general data that doesn't fall into the other categories
-        for key in DATA_LOCATIONS.keys():
-            char_data[key] = raw_data[DATA_LOCATIONS[key][0]][DATA_LOCATIONS[key][1]]
-
-        # talents
-        char_data['talents'] = []
-        for tup in TALENT_LOCATIONS:
-            char_data['talents'].append(raw_data[tup[0]][tup[1]])
-
-        # characteristics
-        char_data['characteristics'] = {}
-        for i in range(len(CHARACTERISTICS)):
-            char_data['characteristics'][CHARACTERISTICS[i]] = \
-                raw_data[CHARACTERISTIC_ROW_START + i][CHARACTERISTIC_COL]
-
-        # skills without specializations
-        char_data['skills'] = {}
-        for i in range(len(SKILLS)):
-            char_data['skills'][SKILLS[i]] = raw_data[SKILL_ROW_START + i][SKILL_COL]
-
-        # specialization skills
-        for i in range(len(SPECIAL_COL_STARTS)):
-            for j in range(len(SPECIAL_ROW_STARTS)):
-                for k in range(BLOCK_LENGTH):
-                    # move down rows for the length of the block, selecting two adjacent values
-                    skill = raw_data[SPECIAL_ROW_STARTS[j] + k][SPECIAL_COL_STARTS[i]]
-                    points = raw_data[SPECIAL_ROW_STARTS[j] + k][SPECIAL_COL_STARTS[i] + 1]
-
-                    if skill and points:
-                        char_data['skills'][skill] = points
-
-        # custom skills
-        for i in range(BLOCK_LENGTH):
-            skill = raw_data[CUSTOM_ROW_START + i][CUSTOM_COL]
-            points = raw_data[CUSTOM_ROW_START + i][CUSTOM_COL + 1]
-
-            if skill and points:
-                char_data['skills'][skill] = points
+    def _get_sheet_layout(self, raw_data: list):
+        for layout in SHEET_LAYOUTS:
+            if layout.matches(raw_data):
+                return layout
 
-        return char_data
+        return None
+
+    def read_char_data(self, raw_data: list):
+        return self._get_sheet_layout(raw_data).read(raw_data)
 
     def _is_char_data_valid(self, char_data: dict):
         errors = set()
@@ -418,13 +1622,13 @@ class CthulhuCaller(commands.Cog):
     def _is_characteristic_valid(self, characteristic: str):
         return characteristic.isnumeric() and int(characteristic) % 5 == 0
     
-    def _get_starting_balances(self, char_data: dict):
-        ch_con = int(char_data['characteristics']['con'])
-        ch_siz = int(char_data['characteristics']['siz'])
-        ch_pow = int(char_data['characteristics']['pow'])
+    def _get_starting_balances(self, char: Character):
+        ch_con = char.characteristic('con')
+        ch_siz = char.characteristic('siz')
+        ch_pow = char.characteristic('pow')
 
         balances = {
-            'luck': int(char_data['luck']),
+            'luck': char.luck,
             'sanity': ch_pow,
             'magic': math.floor(ch_pow / 5),
             'magic_maximum': math.floor(ch_pow / 5),
@@ -449,27 +1653,29 @@ class CthulhuCaller(commands.Cog):
         await self._character_list(ctx, True)
 
     async def _character_list(self, ctx, send_links: bool):
-        characters = await self.config.user(ctx.author).characters()
-        if not characters:
-            await ctx.send("You have no characters.")
+        data = await self._get_user_data(ctx.author)
+        names = data['names']
+        if not names:
+            await self._send(ctx, "You have no characters.")
             return
 
-        active_id = await self.config.user(ctx.author).active_char()
+        active_id = data['active_char']
 
         lines = []
-        for sheet_id in characters.keys():
-            char_data = characters[sheet_id]
-            line = f"{char_data['name']}"
-            if send_links:
+        for sheet_id in names.keys():
+            line = f"{names[sheet_id]}"
+            if send_links and is_file_sheet(sheet_id):
+                line += " (imported from a file)"
+            elif send_links:
                 line += f" ([link]({self.make_link_from_sheet_id(sheet_id)}))"
             line += f" (**active**)" if sheet_id == active_id else ""
             lines.append(line)
 
         if not send_links:
-            await ctx.send("Your characters:\n" + "\n".join(sorted(lines)))
+            await self._send(ctx, "Your characters:\n" + "\n".join(sorted(lines)))
         else:
             await ctx.author.send("Your characters:\n" + "\n".join(sorted(lines)))
-            await ctx.send("List has been sent to your DMs.")
+            await self._send(ctx, "List has been sent to your DMs.")
 
     def make_link_from_sheet_id(self, sheet_id: str):
         return GSHEET_URL_BASE.format(sheet_id)
@@ -480,17 +1686,17 @@ class CthulhuCaller(commands.Cog):
 
         Takes a link to a published Google Sheet or a character name as argument.
         """
-        characters = await self.config.user(ctx.author).characters()
+        data = await self._get_user_data(ctx.author)
+        names = data['names']
 
         character_id = await self.sheet_id_from_query(ctx, query)
 
         if not character_id:
-            await ctx.send(f"Could not find a character to match `{query}`.")
+            await self._send(ctx, f"Could not find a character to match `{query}`.")
             return
 
-        await self.config.user(ctx.author).active_char.set(character_id)
-        char_data = characters[character_id]
-        await ctx.send(f"{char_data['name']} made active.")
+        await self._set_user_value(ctx.author, 'active_char', character_id)
+        await self._send(ctx, f"{names[character_id]} made active.")
 
     @character.command(name="setcolor")
     async def character_color(self, ctx, *, color: str):
@@ -500,26 +1706,28 @@ class CthulhuCaller(commands.Cog):
         `[p]character setcolor #FF8822`
         `[p]character setcolor random`
         """
-        sheet_id = await self.config.user(ctx.author).active_char()
+        data = await self._get_user_data(ctx.author)
+        sheet_id = data['active_char']
         if sheet_id is None:
-            await ctx.send("No character is active. `import` a new character or switch to an " + \
-                "existing one with `character setactive`.")
+            await self._send(ctx, "No character is active. `import` a new character or switch " + \
+                "to an existing one with `character setactive`.")
             return
 
-        data = await self.config.user(ctx.author).characters()
-        name = data[sheet_id]['name']
+        name = data['names'][sheet_id]
 
         if re.match(r"^#?[0-9a-fA-F]{6}$", color) or color.lower() == "random":
-            async with self.config.user(ctx.author).csettings() as csettings:
-                if color.lower() == "random":
-                    csettings[sheet_id]['color'] = None
-                else:
-                    csettings[sheet_id]['color'] = int(color.lstrip("#"), 16)
+            if color.lower() == "random":
+                value = None
+            else:
+                value = int(color.lstrip("#"), 16)
+            async with self._locks.lock((ctx.author.id, sheet_id)):
+                await self._set_character_setting(ctx.author, sheet_id, 'color', value)
+            self._bump_sheet_version(ctx.author, sheet_id, SHEET_APPEARANCE)
             embed = await self._get_base_embed(ctx)
             embed.description = f"Embed color has been set for {name}."
-            await ctx.send(embed=embed)
+            await self._send(ctx, embed=embed)
         else:
-            await ctx.send(f"Could not interpret `{color}` as a color.")
+            await self._send(ctx, f"Could not interpret `{color}` as a color.")
 
     @character.command(name="setimage")
     async def character_image(self, ctx, *, image: str=""):
@@ -527,37 +1735,38 @@ class CthulhuCaller(commands.Cog):
 
         Takes either an attached image, an image link, or "none" (to delete).
         """
-        sheet_id = await self.config.user(ctx.author).active_char()
+        data = await self._get_user_data(ctx.author)
+        sheet_id = data['active_char']
         if sheet_id is None:
-            await ctx.send("No character is active. `import` a new character or switch to an " + \
-                "existing one with `character setactive`.")
+            await self._send(ctx, "No character is active. `import` a new character or switch " + \
+                "to an existing one with `character setactive`.")
             return
 
-        data = await self.config.user(ctx.author).characters()
-        name = data[sheet_id]['name']
+        name = data['names'][sheet_id]
 
         if len(ctx.message.attachments):
             if not ctx.message.attachments[0].content_type.startswith("image"):
-                await ctx.send("Could not interpret the attachment as an image.")
+                await self._send(ctx, "Could not interpret the attachment as an image.")
                 return
             else:
                 url = ctx.message.attachments[0].url
         else:
             if not image:
-                await ctx.send("Could not interpret image link.")
+                await self._send(ctx, "Could not interpret image link.")
                 return
             elif image == "none":
                 url = None
             else:
                 url = image
 
-        async with self.config.user(ctx.author).csettings() as csettings:
-            csettings[sheet_id]['image_url'] = url
+        async with self._locks.lock((ctx.author.id, sheet_id)):
+            await self._set_character_setting(ctx.author, sheet_id, 'image_url', url)
+        self._bump_sheet_version(ctx.author, sheet_id, SHEET_APPEARANCE)
 
         embed = await self._get_base_embed(ctx)
         embed.description = f"Image has been set for {name}."
 
-        await ctx.send(embed=embed)
+        await self._send(ctx, embed=embed)
 
     @character.command(name="remove", aliases=["delete"])
     async def character_remove(self, ctx, *, query: str):
@@ -565,35 +1774,38 @@ class CthulhuCaller(commands.Cog):
         
         Takes a link to a published Google Sheet or a character name as argument.
         """
-        async with self.config.user(ctx.author).characters() as characters:
-            character_id = await self.sheet_id_from_query(ctx, query)
-
-            if not character_id:
-                await ctx.send(f"Could not find a character to match `{query}`.")
-                return
+        data = await self._get_user_data(ctx.author)
+        character_id = await self.sheet_id_from_query(ctx, query)
 
-            char_data = characters[character_id]
-            characters.pop(character_id)
+        if not character_id or character_id not in data['names']:
+            await self._send(ctx, f"Could not find a character to match `{query}`.")
+            return
 
-            async with self.config.user(ctx.author).csettings() as csettings:
-                if character_id in csettings:
-                    csettings.pop(character_id)
+        name = data['names'][character_id]
+        async with self._locks.lock((ctx.author.id, character_id)):
+            self._drop_balances(ctx.author.id, character_id)
+            self._note_written(ctx.author.id)
+            with self.metrics.phase("config_write"):
+                await self._character_group(ctx.author.id, character_id).clear()
+            self._characters.pop((ctx.author.id, character_id), None)
+            self._skill_indexes.pop((ctx.author.id, character_id), None)
+            self._forget_sheet((ctx.author.id, character_id))
+        await self._set_names(ctx.author, {character_id: None})
 
-            if await self.config.user(ctx.author).active_char() == character_id:
-                await self.config.user(ctx.author).active_char.set(None)
+        if data['active_char'] == character_id:
+            await self._set_user_value(ctx.author, 'active_char', None)
 
-            await ctx.send(f"{char_data['name']} has been removed from your characters.")
+        await self._send(ctx, f"{name} has been removed from your characters.")
 
     async def sheet_id_from_query(self, ctx, query: str):
         if re.match(GSHEET_URL_TEMPLATE, query):
             return self._get_sheet_identifier_from_url(query)
         else:
             query = query.lower()
-            characters = await self.config.user(ctx.author).characters()
+            names = (await self._get_user_data(ctx.author))['names']
 
-            for sheet_id in characters.keys():
-                char_data = characters[sheet_id]
-                if query in char_data['name'].lower():
+            for sheet_id in names.keys():
+                if query in names[sheet_id].lower():
                     return sheet_id
 
         return None
@@ -602,10 +1814,12 @@ class CthulhuCaller(commands.Cog):
     async def luckdisplay(self, ctx, setting: str=""):
         """Toggle if luck spending will be shown in the check footer."""
         if setting and setting.lower() not in ["off", "on"]:
-            await ctx.send("Setting should be \"off\" or \"on\" (or left out, to just toggle).")
+            await self._send(ctx, "Setting should be \"off\" or \"on\" (or left out, to just " + \
+                "toggle).")
             return
 
-        async with self.config.user(ctx.author).preferences() as preferences:
+        async with self._locks.lock((ctx.author.id, None)):
+            preferences = (await self._get_user_data(ctx.author))['preferences']
             if 'luck_display' not in preferences:
                 preferences['luck_display'] = True
             current_setting = preferences['luck_display']
@@ -618,10 +1832,11 @@ class CthulhuCaller(commands.Cog):
                 new_setting = not current_setting
 
             preferences['luck_display'] = new_setting
+            await self._set_user_value(ctx.author, 'preferences', preferences)
 
         label = "on" if new_setting else "off"
 
-        await ctx.send(f"Turned luck display **{label}** for all characters.")
+        await self._send(ctx, f"Turned luck display **{label}** for all characters.")
 
     @commands.command(aliases=["c"])
     async def check(self, ctx, *, query):
@@ -629,7 +1844,12 @@ class CthulhuCaller(commands.Cog):
         
         Takes a plain DC as argument, or a check name (to make the roll as the active character).
         """
-        await self._check(ctx, query, False)
+        try:
+            await self._check(ctx, query, False)
+        except TooManyDice:
+            await self._send(ctx, self._get_too_many_dice_text())
+        except UnrollableDice as e:
+            await self._send(ctx, self._get_unrollable_text(e))
 
     @commands.command()
     async def research(self, ctx, *, query):
@@ -637,39 +1857,53 @@ class CthulhuCaller(commands.Cog):
 
         Takes a plain DC as argument, or a check name (to make the roll as the active character).
         """
-        await self._check(ctx, query, True)
+        try:
+            await self._check(ctx, query, True)
+        except TooManyDice:
+            await self._send(ctx, self._get_too_many_dice_text())
+        except UnrollableDice as e:
+            await self._send(ctx, self._get_unrollable_text(e))
+
+    def _get_too_many_dice_text(self):
+        return f"Checks can have at most {MAX_NET_DICE} bonus or penalty dice."
+
+    def _get_unrollable_text(self, error: UnrollableDice):
+        expr, reason = error.args
+        return f"Could not roll `{expr}`: {reason}"
     
     async def _check(self, ctx, query, is_research: bool):
         processed_query = self.process_query(query)
 
         dc = None
         skill = None
-        data = await self.config.user(ctx.author).characters()
-        preferences = await self.config.user(ctx.author).preferences()
+        alternatives_text = ""
+        data = await self._get_user_data(ctx.author)
+        preferences = data['preferences']
 
         if processed_query['query'].isnumeric():
             dc = int(processed_query['query'])
-            char_data = None
+            char = None
         else:
-            sheet_id = await self.config.user(ctx.author).active_char()
+            sheet_id = data['active_char']
             if sheet_id is None:
-                await ctx.send("No character is active. `import` a new character or switch to " + \
-                    "an existing one with `character setactive`.")
+                await self._send(ctx, "No character is active. `import` a new character or " + \
+                    "switch to an existing one with `character setactive`.")
                 return
 
-            char_data = data[sheet_id]
-            settings = await self.config.user(ctx.author).csettings()
-            balances = settings[sheet_id]['balances']
+            char, settings = await self._get_character(ctx.author, sheet_id)
+            balances = settings['balances']
 
             check_name = processed_query['query'].lower()
-            dc, skill = self.find_skill(check_name, char_data, balances)
+            index = self._get_skill_index(ctx.author, sheet_id, char)
+            dc, skill = self.find_skill(check_name, char, balances, index)
+            alternatives_text = self._get_alternatives_text(check_name, skill, index)
 
-            talent_bonus = self._get_talent_bonus(char_data['talents'], skill)
+            talent_bonus = skill is not None and self._get_talent_bonus(char.talents, skill)
             if talent_bonus:
                 processed_query['bonus'].append("1")
 
         if dc is None:
-            await ctx.send(f"Could not understand `{check_name}`.")
+            await self._send(ctx, f"Could not understand `{check_name}`.")
             return
 
         bonus_str = self._get_rollable_arg(processed_query['bonus'])
@@ -677,12 +1911,11 @@ class CthulhuCaller(commands.Cog):
         phrase_str = "\n".join(processed_query['phrase'])
         repetition_str = self._get_single_rollable_arg(processed_query['rr'])
 
-        dc_str = f"({dc}/{math.floor(dc / 2)}/{math.floor(dc / 5)})" if skill != "Sanity" \
-            else f"({dc})"
+        dc_str = self._get_dc_text(dc, skill)
         research_str = " to research" if is_research else ""
 
         if skill is not None:
-            name = char_data['name']
+            name = char.name
             article = "an" if skill.lower()[0] in ["a", "e", "i", "o", "u"] else "a"
             title_text = f"{name} makes {article} {skill} {dc_str} roll{research_str}!"
         else:
@@ -691,11 +1924,39 @@ class CthulhuCaller(commands.Cog):
         embed = await self._get_base_embed(ctx)
         embed.title = title_text
 
-        if not repetition_str or d20.roll(repetition_str).total == 1:
-            roll_text, degree_text, luck_text = \
-                self.perform_skill_roll(dc, bonus_str, penalty_str, skill)
+        if processed_query['odds']:
+            if "d" in bonus_str + penalty_str:
+                await self._send(ctx, "Odds can only be worked out for a set number of bonus " + \
+                    "and penalty dice.")
+                return
+
+            if skill is not None:
+                embed.title = f"{name}'s odds on {article} {skill} {dc_str} roll{research_str}"
+            else:
+                embed.title = f"Odds on a DC {dc_str} roll{research_str}"
+
+            net_dice = self._get_net_dice(bonus_str, penalty_str)
+            if abs(net_dice) > MAX_NET_DICE:
+                await self._send(ctx, self._get_too_many_dice_text())
+                return
+
+            description = self._get_odds_text(dc, net_dice, skill == "Sanity", is_research)
+            if phrase_str:
+                description = f"{description}\n> *{phrase_str.strip()}*"
+            if alternatives_text:
+                description = f"{description}\n{alternatives_text}"
+            embed.description = description
+
+            await self._send(ctx, embed=embed)
+            return
+
+        repetitions = roll_total(repetition_str) if repetition_str else 1
+        if repetitions == 1:
+            with self.metrics.phase("roll"):
+                roll_text, degree_text, luck_text, outcome = \
+                    self.perform_skill_roll(dc, bonus_str, penalty_str, skill)
 
-            rp = self._get_research_points(degree_text)
+            rp = OUTCOME_RESEARCH_POINTS[outcome]
             plural = "s" if rp > 1 else ""
             research_text = f" (**{rp}** research point{plural})" if is_research and rp > 0 else ""
 
@@ -708,12 +1969,28 @@ class CthulhuCaller(commands.Cog):
             if not ('luck_display' in preferences and not preferences['luck_display']) and \
                 not is_research:
                 embed.set_footer(text=luck_text)
+        elif repetitions > RR_FIELD_LIMIT:
+            with self.metrics.phase("roll"):
+                summary_text, rp = self.summarize_skill_rolls(dc, bonus_str, penalty_str, skill,
+                    min(repetitions, RR_MAX), is_research)
+
+            plural = "s" if rp > 1 else ""
+            description = summary_text
+            if repetitions > RR_MAX:
+                description = f"{description}\n*At most {RR_MAX} rolls can be made together, " + \
+                    f"not {repetitions}.*"
+            if is_research and rp > 0:
+                description = f"{description}\n**{rp}** total research point{plural}!"
+            if phrase_str:
+                description = f"{description}\n> *{phrase_str.strip()}*"
+            embed.description = description
         else:
             rp = 0
-            for i in range(d20.roll(repetition_str).total):
-                roll_text, degree_text, luck_text = \
-                    self.perform_skill_roll(dc, bonus_str, penalty_str, skill)
-                curr_rp = self._get_research_points(degree_text)
+            for i in range(repetitions):
+                with self.metrics.phase("roll"):
+                    roll_text, degree_text, luck_text, outcome = \
+                        self.perform_skill_roll(dc, bonus_str, penalty_str, skill)
+                curr_rp = OUTCOME_RESEARCH_POINTS[outcome]
                 rp += curr_rp
 
                 plural = "s" if curr_rp > 1 else ""
@@ -738,143 +2015,167 @@ class CthulhuCaller(commands.Cog):
             elif is_research and rp > 0:
                 embed.description = f"**{rp}** total research point{plural}!"
 
-        await ctx.send(embed=embed)
+        if alternatives_text:
+            embed.description = f"{embed.description}\n{alternatives_text}" if embed.description \
+                else alternatives_text
 
-    def process_query(self, query_str: str):
-        processed_flags = self._get_base_flags()
+        await self._send(ctx, embed=embed)
 
-        # prepend a space so the flag finding will succeed even with no query. hey, if it works...
-        # also append a space so argless flags at the end won't poison the previous flag's arg
-        query_str = " " + query_str + " "
+    def _get_alternatives_text(self, check_name: str, skill: str, index: SkillIndex):
+        """List the other skills a check name could have meant, unless it named one exactly."""
+        if skill is None or check_name == skill.lower() or check_name in SkillIndex.exact:
+            return ""
 
-        flag_locs = []
-        search_start = 0
-        while search_start < len(query_str):
-            # looks for instances of all the flags simultaneously
-            next_flags = [query_str.find(f" -{flag} ", search_start) for flag in KNOWN_FLAGS]
+        others = list(dict.fromkeys([label for _, _, label in index.candidates(check_name)
+            if label != skill]))
+        if not others:
+            return ""
 
-            # no more flags, end loop
-            if all([f < 0 for f in next_flags]):
-                break
-            # save location of earliest flag
-            else:
-                while -1 in next_flags:
-                    next_flags.remove(-1)
-                next_flag = min(next_flags)
-                flag_locs.append(next_flag)
-                search_start = next_flag + 2
-        flag_locs.sort()
-
-        if not flag_locs:
-            processed_flags['query'] = query_str.strip()
-        else:
-            processed_flags['query'] = query_str[:flag_locs[0]].strip()
+        more = ", ..." if len(others) > ALTERNATIVES_SHOWN else ""
+        return f"*Also matches: {', '.join(others[:ALTERNATIVES_SHOWN])}{more}*"
 
-        for i in range(len(flag_locs)):
-            if i == len(flag_locs) - 1:
-                flag_and_arg = query_str[flag_locs[i]:]
-            else:
-                flag_and_arg = query_str[flag_locs[i]:flag_locs[i + 1]]
-
-            flag_and_arg = flag_and_arg.strip()[1:]
-            # split only on the first space, if it exists
-            flag_and_arg = flag_and_arg.split(" ", 1)
-
-            flag = flag_and_arg[0]
-            if len(flag_and_arg) > 1:
-                arg = flag_and_arg[1]
-                # TODO: maybe give this another try later. for now, flags (with -) only
-                # arg_str = flag_and_arg[1]
-
-                # # if this begins with a double quote, the arg ends at the final double quote
-                # if len(arg_str) > 1 and arg_str.strip()[0] in DOUBLE_QUOTES:
-                #     end = max([arg_str.rfind(q) for q in DOUBLE_QUOTES])
-                # # if not, the arg ends after one word
-                # else:
-                #     end = arg_str.find(" ") if " " in arg_str else len(arg_str)
-                # arg = arg_str[:end]
-
-                # # search what remains for additional bonus/penalty indicators
-                # search_str = arg_str[end:].lower()
-                # if "bonus" in search_str or "adv" in search_str:
-                #     processed_flags['bonus'].append("1")
-                # if "penalty" in search_str or "dis" in search_str:
-                #     processed_flags['penalty'].append("1")
-            else:
-                arg = ""
+    @commands.command(aliases=["pcheck"])
+    @commands.guild_only()
+    async def partycheck(self, ctx, *, query):
+        """Make the same check for several characters at once.
 
-            arg = arg.strip()
-            if len(arg) > 1 and arg[0] in DOUBLE_QUOTES and arg[-1] in DOUBLE_QUOTES:
-                arg = arg[1:-1]
+        Takes a check name and mentions of everyone who should roll, who each roll as their
+        active character. The results come back together, best first. Example:
+        `[p]partycheck spot hidden @Alice @Bob -bonus 1`
+        """
+        users = []
+        for user in ctx.message.mentions:
+            if not user.bot and user not in users:
+                users.append(user)
 
-            processed_flags[flag].append(arg)
+        if not users:
+            await self._send(ctx, "Mention everyone who should make the check.")
+            return
+        elif len(users) > RR_FIELD_LIMIT:
+            await self._send(ctx, f"At most {RR_FIELD_LIMIT} characters can roll together.")
+            return
 
-        return processed_flags
+        processed_query = self.process_query(re.sub(MENTION_PATTERN, "", query))
+        check_name = processed_query['query'].lower()
+        if not check_name:
+            await self._send(ctx, "Say which check to make, as well as who should make it.")
+            return
 
-    def _get_base_flags(self):
-        processed_flags = {'query': ""}
-        for flag in KNOWN_FLAGS:
-            processed_flags[flag] = []
-        return processed_flags
+        penalty_str = self._get_rollable_arg(processed_query['penalty'])
+        phrase_str = "\n".join(processed_query['phrase'])
 
-    def find_skill(self, check_name: str, char_data: dict, balances: dict):
-        if check_name == "know":
-            return int(char_data['characteristics']['edu']), "Know"
+        # every user's data and character is read at once
+        party = await asyncio.gather(*[self._get_active_character(user) for user in users])
 
-        if check_name == "idea":
-            return int(char_data['characteristics']['int']), "Idea"
+        rolls = []
+        problems = []
+        for user, (data, sheet_id, char, settings) in zip(users, party):
+            if char is None:
+                problems.append(f"{user.display_name} has no active character.")
+                continue
 
-        if check_name == "luck":
-            return int(balances['luck']), "Luck"
+            index = self._get_skill_index(user, sheet_id, char)
+            dc, skill = self.find_skill(check_name, char, settings['balances'], index)
+            if dc is None:
+                problems.append(f"Could not understand `{check_name}` for {char.name}.")
+                continue
 
-        if check_name in "sanity":
-            return int(balances['sanity']), "Sanity"
+            bonus_args = processed_query['bonus']
+            if self._get_talent_bonus(char.talents, skill):
+                bonus_args = bonus_args + ["1"]
+            bonus_str = self._get_rollable_arg(bonus_args)
 
-        if check_name in "spellcasting":
-            return int(char_data['characteristics']['pow']), "Spellcasting"
+            try:
+                with self.metrics.phase("roll"):
+                    roll_text, degree_text, luck_text, outcome = \
+                        self.perform_skill_roll(dc, bonus_str, penalty_str, skill)
+            except TooManyDice:
+                await self._send(ctx, self._get_too_many_dice_text())
+                return
+            except UnrollableDice as e:
+                await self._send(ctx, self._get_unrollable_text(e))
+                return
+
+            # show by default until toggled
+            preferences = data['preferences']
+            if 'luck_display' in preferences and not preferences['luck_display']:
+                luck_text = ""
+
+            rolls.append((outcome, char.name, skill, f"{char.name} {self._get_dc_text(dc, skill)}",
+                f"{degree_text}{luck_text}\n{roll_text}"))
+
+        if not rolls:
+            await self._send(ctx, "\n".join(problems))
+            return
+
+        rolls.sort(key=lambda roll: (roll[0], roll[1].lower()))
+
+        skills = {skill for _, _, skill, _, _ in rolls}
+        skill = skills.pop() if len(skills) == 1 else processed_query['query']
+        article = "an" if skill.lower()[0] in ["a", "e", "i", "o", "u"] else "a"
 
-        for ch in char_data['characteristics'].keys():
-            if check_name in ch.lower():
-                return int(char_data['characteristics'][ch]), ch.upper()
+        embed = await self._get_base_embed(ctx)
+        embed.title = f"The party makes {article} {skill} roll!"
+        for _, _, _, field_name, field_text in rolls:
+            embed.add_field(name=field_name, value=field_text)
+
+        description_lines = problems
+        if phrase_str:
+            description_lines.append(f"> *{phrase_str.strip()}*")
+        if description_lines:
+            embed.description = "\n".join(description_lines)
+
+        await self._send(ctx, embed=embed)
 
-        for alias in CHARACTERISTIC_ALIASES.keys():
-            if check_name in alias:
-                ch = CHARACTERISTIC_ALIASES[alias]
-                return int(char_data['characteristics'][ch]), ch.upper()
+    async def _get_active_character(self, user):
+        """Get the user's data, and their active sheet id, character and its settings (all None
+        if no character is active).
+        """
+        data = await self._get_user_data(user)
+        sheet_id = data['active_char']
+        if sheet_id is None:
+            return data, None, None, None
 
-        if check_name == "psych":
-            return int(char_data['skills']['Psychology']), "Psychology"
+        char, settings = await self._get_character(user, sheet_id)
+        return data, sheet_id, char, settings
 
-        for sk in char_data['skills'].keys():
-            if check_name in sk.lower():
-                return int(char_data['skills'][sk]), sk
+    def _get_dc_text(self, dc: int, skill: str):
+        if skill == "Sanity":
+            return f"({dc})"
+        return f"({dc}/{math.floor(dc / 2)}/{math.floor(dc / 5)})"
 
-        for sk in UMBRELLA_SKILLS:
-            if check_name in sk.lower():
-                return ALL_SKILL_MINS[sk], sk
+    def process_query(self, query_str: str):
+        return parse_query(query_str)
 
-        return None, None
+    def find_skill(self, check_name: str, char: Character, balances: dict,
+        index: SkillIndex=None):
+        if index is None:
+            target = SkillIndex.find_in(check_name, SkillIndex.lower_names(char.extra_skills))
+        else:
+            target = index.find(check_name)
+        if target is None:
+            return None, None
+
+        source, key, label = target
+        if source == "balances":
+            return balances[key], label
+        elif source == "umbrella":
+            return ALL_SKILL_MINS[key], label
+        elif source == "characteristics":
+            return char.characteristic(key), label
+        else:
+            return char.skill(key), label
 
     # for a flag that should only have been used once
     def _get_single_rollable_arg(self, args: list):
-        try:
-            d20.roll(args[0])
+        # only parsed here, anything that parses but can't be rolled is caught by the roll itself
+        if args and is_dice(args[0]):
             return args[0]
-        # should catch both empty list and not rollable
-        except:
-            return ""
+        return ""
 
     def _get_rollable_arg(self, args: list):
-        rollable_args = []
-        for arg in args:
-            # perhaps hacky but it works
-            try:
-                d20.roll(arg)
-                rollable_args.append(arg)
-            except:
-                # this was invalid and not rollable, don't use it
-                pass
-        return " + ".join(rollable_args)
+        # invalid args aren't used
+        return " + ".join([arg for arg in args if is_dice(arg)])
 
     def _get_talent_bonus(self, talents: list, skill: str):
         if "Animal Companion" in talents and skill == "Animal Handling" or \
@@ -898,31 +2199,95 @@ class CthulhuCaller(commands.Cog):
         else:
             return self._perform_skill_roll(dc, bonus_str, penalty_str, False)
 
-    def _perform_skill_roll(self, dc: int, bonus_str: str, penalty_str: str, is_san: bool):
-        bonus = d20.roll(bonus_str).total if bonus_str else 0
-        penalty = d20.roll(penalty_str).total if penalty_str else 0
-        net_dice = bonus - penalty
-
-        if net_dice == 0:
-            # no need to show extra dice, simplify to a d100
-            hundreds = d20.roll("1d100")
-            roll_total = hundreds.total
-            roll_text = str(hundreds)
+    def summarize_skill_rolls(self, dc: int, bonus_str: str, penalty_str: str, skill: str,
+        count: int, is_research: bool):
+        """Make many rolls at once, counting them up by degree of success.
+
+        Returns the summary text and the total research points.
+        """
+        is_san = skill == "Sanity"
+
+        if "d" in bonus_str + penalty_str:
+            net_dice = [self._get_net_dice(bonus_str, penalty_str) for i in range(count)]
         else:
-            # tens is 0-indexed: 00 through 90
-            tens = d20.roll(self.make_tens_string(net_dice))
-            # ones is 1-indexed: 01 through 10
-            ones = d20.roll("1d10")
-            roll_total = (tens.total * 10) + ones.total
-            roll_text = f"{str(tens)}, {str(ones)} -> `{roll_total}`"
-
-        to_success, to_hard, to_extreme, degree_of_success = \
-            self._get_degree_of_success(dc, roll_total)
+            # nothing to reroll, every roll gets the same dice
+            net_dice = [self._get_net_dice(bonus_str, penalty_str)] * count
+
+        # every total can only mean one thing at this dc
+        if 0 <= dc <= TABLE_MAX_DC:
+            outcomes = [row[0] if row else None for row in OUTCOME_TABLE[dc]]
+        else:
+            outcomes = [None] + [get_outcome(dc, total)[0] for total in range(1, 101)]
+
+        totals = [0] * 101
+        for total in self.dice.roll_totals(net_dice):
+            totals[total] += 1
+
+        counts = [0] * len(OUTCOME_TEXTS)
+        for total in range(1, 101):
+            if totals[total]:
+                counts[self._get_sanity_outcome(outcomes[total], is_san)] += totals[total]
+
+        rp = sum([OUTCOME_RESEARCH_POINTS[outcome] * n for outcome, n in enumerate(counts)]) \
+            if is_research else 0
+
+        lines = [f"{count} rolls:"]
+        for outcome, n in enumerate(counts):
+            if n:
+                lines.append(f"{self._get_outcome_text(outcome, is_san)}: {n}")
+
+        return "\n".join(lines), rp
+
+    def _get_odds_text(self, dc: int, net_dice: int, is_san: bool, is_research: bool):
+        chances, luck = check_odds(dc, net_dice)
+
+        lines = []
+        if net_dice:
+            kind = "bonus" if net_dice > 0 else "penalty"
+            plural = "dice" if abs(net_dice) > 1 else "die"
+            lines.append(f"With {abs(net_dice)} {kind} {plural}:")
+
         if is_san:
             # only pass or fail
-            degree_text = "**Success**" if "Success" in degree_of_success else "**Failure**"
+            success = sum(chances[:REGULAR + 1])
+            lines.append(f"**Success**: {self._format_chance(success)}")
+            lines.append(f"**Failure**: {self._format_chance(1 - success)}")
         else:
-            degree_text = f"{degree_of_success}"
+            for outcome, chance in enumerate(chances):
+                # check_odds has already decided which way these go
+                if outcome != FUMBLE_BELOW_50:
+                    lines.append(f"{OUTCOME_TEXTS[outcome]}: {self._format_chance(chance)}")
+
+        if is_research:
+            points = sum([chance * OUTCOME_RESEARCH_POINTS[outcome]
+                for outcome, chance in enumerate(chances)])
+            lines.append(f"Expected research points: {float(points):.2f}")
+        elif not is_san:
+            for target, (chance, cost) in zip(LUCK_TARGETS, luck):
+                if chance:
+                    lines.append(f"{target} with Luck: {self._format_chance(chance)} of " + \
+                        f"rolls, {float(cost):.1f} Luck on average")
+
+        return "\n".join(lines)
+
+    def _format_chance(self, chance):
+        if 0 < chance < Fraction(1, 10000):
+            return "<0.01%"
+        return f"{float(chance) * 100:.2f}%"
+
+    def _get_net_dice(self, bonus_str: str, penalty_str: str):
+        bonus = roll_total(bonus_str) if bonus_str else 0
+        penalty = roll_total(penalty_str) if penalty_str else 0
+        return bonus - penalty
+
+    def _perform_skill_roll(self, dc: int, bonus_str: str, penalty_str: str, is_san: bool):
+        net_dice = self._get_net_dice(bonus_str, penalty_str)
+
+        roll_total, roll_text = self.dice.roll_check(net_dice)
+
+        outcome, to_success, to_hard, to_extreme = get_outcome(dc, roll_total)
+        outcome = self._get_sanity_outcome(outcome, is_san)
+        degree_text = self._get_outcome_text(outcome, is_san)
 
         luck_strs = []
         if to_success is not None:
@@ -934,96 +2299,82 @@ class CthulhuCaller(commands.Cog):
         luck_str = ", ".join(luck_strs)
         luck_text = " (" + luck_str + ")" if (luck_str and not is_san) else ""
 
-        return roll_text, degree_text, luck_text
+        return roll_text, degree_text, luck_text, outcome
 
-    def make_tens_string(self, net_dice: int):
-        if net_dice > 0:
-            return f"{abs(net_dice) + 1}d10kl1 - 1"
-        else:
-            return f"{abs(net_dice) + 1}d10kh1 - 1"
-
-    def _get_degree_of_success(self, dc: int, roll_total: int):
-        extreme_dc = math.floor(dc / 5)
-        hard_dc = math.floor(dc / 2)
-
-        if roll_total == 1:
-            return None, None, None, "**Critical Success**"
-        elif roll_total <= extreme_dc:
-            return None, None, None, "**Extreme Success**"
-        elif roll_total <= hard_dc:
-            return None, None, roll_total - extreme_dc, "**Hard Success**"
-        elif roll_total <= dc:
-            return None, roll_total - hard_dc, roll_total - extreme_dc, "**Regular Success**"
-        elif roll_total > 99:
-            return None, None, None, "**Fumble**"
-        elif roll_total >= 96:
-            return None, None, None, "**Fumble** (if success requires a result below 50)"
-        else:
-            return roll_total - dc, roll_total - hard_dc, roll_total - extreme_dc, "**Failure**"
-
-    def _get_research_points(self, degree: str):
-        if "Critical Success" in degree:
-            return 6
-        elif "Extreme Success" in degree:
-            return 4
-        elif "Hard Success" in degree:
-            return 2
-        elif "Regular Success" in degree or "Success" in degree:
-            return 1
-        else:
-            return 0
+    def _get_sanity_outcome(self, outcome: int, is_san: bool):
+        # sanity rolls only pass or fail
+        if is_san:
+            return REGULAR if outcome <= REGULAR else FAILURE
+        return outcome
+
+    def _get_outcome_text(self, outcome: int, is_san: bool):
+        if is_san:
+            return "**Success**" if outcome <= REGULAR else "**Failure**"
+        return OUTCOME_TEXTS[outcome]
 
     @commands.command()
     async def sheet(self, ctx):
         """Show the active character's sheet."""
-        sheet_id = await self.config.user(ctx.author).active_char()
+        data = await self._get_user_data(ctx.author)
+        sheet_id = data['active_char']
         if sheet_id is None:
-            await ctx.send("No character is active. `import` a new character or switch to an " + \
-                "existing one with `character setactive`.")
+            await self._send(ctx, "No character is active. `import` a new character or switch " + \
+                "to an existing one with `character setactive`.")
             return
 
-        data = await self.config.user(ctx.author).characters()
-        char_data = data[sheet_id]
-        characteristics = char_data['characteristics']
-        skills = char_data['skills']
+        char, settings = await self._get_character(ctx.author, sheet_id)
 
-        settings = await self.config.user(ctx.author).csettings()
-        balances = settings[sheet_id]['balances']
+        embed = self._get_sheet_embed(ctx.author, sheet_id)
+        if embed is not None:
+            if not settings.get('color'):
+                # a random color is picked anew every time
+                embed.colour = discord.Colour(random.randint(0x000000, 0xFFFFFF))
+            await self._send(ctx, embed=embed)
+            return
+
+        balances = settings['balances']
 
         embed = await self._get_base_embed(ctx)
-        embed.title = f"{char_data['name']}"
+        with self.metrics.phase("render"):
+            self._render_sheet(embed, char, balances)
+
+        self._cache_sheet_embed(ctx.author, sheet_id, embed)
+        await self._send(ctx, embed=embed)
+
+    def _render_sheet(self, embed, char: Character, balances: dict):
+        embed.title = f"{char.name}"
 
         desc_lines = []
-        desc_lines.append(f"{char_data['archetype']}")
+        desc_lines.append(f"{char.archetype}")
         desc_lines.append(f"**Luck**: {balances['luck']}")
         desc_lines.append(f"**Sanity**: {balances['sanity']}")
         desc_lines.append(f"**Health**: {balances['health']}/{balances['health_maximum']}")
         desc_lines.append(f"**Magic**: {balances['magic']}/{balances['magic_maximum']}")
-        desc_lines.append(f"**Talents**: {', '.join(char_data['talents'])}")
-        if "Psychic Power" in char_data['talents'] and char_data['psychic_power']:
-            desc_lines.append(f"**Psychic Power**: {char_data['psychic_power']}")
+        desc_lines.append(f"**Talents**: {', '.join(char.talents)}")
+        if "Psychic Power" in char.talents and char.psychic_power:
+            desc_lines.append(f"**Psychic Power**: {char.psychic_power}")
 
-        damage_bonus, build, movement = self.calculate_damage_build_mov(characteristics)
+        damage_bonus, build, movement = self.calculate_damage_build_mov(char)
         desc_lines.append(f"**Damage Bonus**: {damage_bonus} **Build**: {build} " + \
             f"**Move Rate**: {movement}")
         embed.description = "\n".join(desc_lines)
 
         characteristic_lines = []
-        for ch in characteristics.keys():
-            characteristic_lines.append(f"**{ch.upper()}**: {characteristics[ch].zfill(2)}")
+        for ch, value in zip(CHARACTERISTICS, char.characteristics):
+            characteristic_lines.append(f"**{ch.upper()}**: {value:02d}")
         characteristic_field = " ".join(characteristic_lines[:4]) + "\n" + \
             " ".join(characteristic_lines[4:])
         embed.add_field(name="Characteristics", value=characteristic_field, inline=False)
 
         skill_lines = []
-        for skill in skills.keys():
-            skill_lines.append(f"{skill}: {skills[skill].zfill(2)}")
+        for skill, value in char.skill_items():
+            skill_lines.append(f"{skill}: {value:02d}")
 
         default_lines = skill_lines[:len(SKILLS)]
         custom_lines = skill_lines[len(SKILLS):]
 
         for skill in UMBRELLA_SKILLS:
-            default_lines.append(f"{skill}: {str(ALL_SKILL_MINS[skill]).zfill(2)}")
+            default_lines.append(f"{skill}: {ALL_SKILL_MINS[skill]:02d}")
 
         half_count = math.floor((len(SKILLS) + len(UMBRELLA_SKILLS)) / 2)
         skill_field_1 = "\n".join(sorted(default_lines)[:half_count])
@@ -1033,29 +2384,29 @@ class CthulhuCaller(commands.Cog):
         embed.add_field(name="Skills (cont.)", value=skill_field_2, inline=True)
         embed.add_field(name="Custom Skills", value=custom_field, inline=True)
 
-        await ctx.send(embed=embed)
-
     async def _get_base_embed(self, ctx):
         embed = discord.Embed()
 
-        sheet_id = await self.config.user(ctx.author).active_char()
-        settings = await self.config.user(ctx.author).csettings()
+        data = await self._get_user_data(ctx.author)
+        sheet_id = data['active_char']
+        settings = {}
+        if sheet_id is not None:
+            _, settings = await self._get_character(ctx.author, sheet_id)
 
-        if sheet_id in settings and 'color' in settings[sheet_id] and settings[sheet_id]['color']:
-            embed.colour = discord.Colour(settings[sheet_id]['color'])
+        if settings and 'color' in settings and settings['color']:
+            embed.colour = discord.Colour(settings['color'])
         else:
             embed.colour = discord.Colour(random.randint(0x000000, 0xFFFFFF))
 
-        if sheet_id in settings and 'image_url' in settings[sheet_id] and \
-            settings[sheet_id]['image_url']:
-            embed.set_thumbnail(url=settings[sheet_id]['image_url'])
+        if settings and 'image_url' in settings and settings['image_url']:
+            embed.set_thumbnail(url=settings['image_url'])
 
         return embed
 
-    def calculate_damage_build_mov(self, characteristics: dict):
-        ch_str = int(characteristics['str'])
-        ch_dex = int(characteristics['dex'])
-        ch_siz = int(characteristics['siz'])
+    def calculate_damage_build_mov(self, char: Character):
+        ch_str = char.characteristic('str')
+        ch_dex = char.characteristic('dex')
+        ch_siz = char.characteristic('siz')
 
         for upper_thresh in DAMAGE_BUILD_CHART.keys():
             if ch_str + ch_siz <= upper_thresh:
@@ -1117,80 +2468,83 @@ class CthulhuCaller(commands.Cog):
         await self.modify_balance(ctx, amount, "magic")
 
     async def modify_balance(self, ctx, amount: str, value_type: str):
-        sheet_id = await self.config.user(ctx.author).active_char()
+        data = await self._get_user_data(ctx.author)
+        sheet_id = data['active_char']
         if sheet_id is None:
-            await ctx.send("No character is active. `import` a new character or switch to an " + \
-                "existing one with `character setactive`.")
+            await self._send(ctx, "No character is active. `import` a new character or switch " + \
+                "to an existing one with `character setactive`.")
             return
 
-        data = await self.config.user(ctx.author).characters()
-        char_data = data[sheet_id]
-
-        async with self.config.user(ctx.author).csettings() as settings:
-            balances = settings[sheet_id]['balances']
-            curr_value = balances[value_type]
-
-            if value_type == "luck":
-                max_value = 99
-            elif value_type == "sanity":
-                max_value = 99 - int(char_data['skills']['Cthulhu Mythos'])
-            elif value_type == "health":
-                max_value = balances['health_maximum']
-            elif value_type == "magic":
-                max_value = balances['magic_maximum']
-
-            if amount == "max":
-                new_value = max_value
-            elif amount.startswith("set ") and len(amount) > 4:
-                try:
-                    new_value = min(max_value, max(0, d20.roll(amount[4:]).total))
-                except:
-                    await ctx.send("Could not interpret that amount as an integer or dice roll.")
-                    return
-            elif amount:
-                try:
-                    delta = d20.roll(amount).total
-                    if delta < 0:
-                        new_value = max(0, curr_value + delta)
-                    else:
-                        new_value = min(max_value, curr_value + delta)
-                except:
-                    await ctx.send("Could not interpret that amount as an integer or dice roll.")
-                    return
-            else:
-                # no amount was given, just display
-                output = f"{value_type.capitalize()}: {curr_value}"
-                if value_type == "health" or value_type == "magic":
-                    output += f"/{balances[f'{value_type}_maximum']}"
-                await ctx.send(output)
-                return
+        async with self._locks.lock((ctx.author.id, sheet_id)):
+            output = await self._change_balance(ctx.author, sheet_id, amount, value_type)
+
+        await self._send(ctx, output)
+
+    async def _change_balance(self, user, sheet_id: str, amount: str, value_type: str):
+        """Change one of the character's balances, returning what to reply with."""
+        char, settings = await self._get_character(user, sheet_id)
+        balances = settings['balances']
+        curr_value = balances[value_type]
+
+        if value_type == "luck":
+            max_value = 99
+        elif value_type == "sanity":
+            max_value = 99 - char.skill('Cthulhu Mythos')
+        elif value_type == "health":
+            max_value = balances['health_maximum']
+        elif value_type == "magic":
+            max_value = balances['magic_maximum']
+
+        if amount == "max":
+            new_value = max_value
+        elif amount.startswith("set ") and len(amount) > 4:
+            try:
+                new_value = min(max_value, max(0, roll_dice(amount[4:]).total))
+            except:
+                return "Could not interpret that amount as an integer or dice roll."
+        elif amount:
+            try:
+                delta = roll_dice(amount).total
+                if delta < 0:
+                    new_value = max(0, curr_value + delta)
+                else:
+                    new_value = min(max_value, curr_value + delta)
+            except:
+                return "Could not interpret that amount as an integer or dice roll."
+        else:
+            # no amount was given, just display
+            output = f"{value_type.capitalize()}: {curr_value}"
+            if value_type == "health" or value_type == "magic":
+                output += f"/{balances[f'{value_type}_maximum']}"
+            return output
 
-            balances[value_type] = new_value
+        balances[value_type] = new_value
+        self._journal_balances(user, sheet_id, balances)
+        self._bump_sheet_version(user, sheet_id, SHEET_BALANCES)
 
-            value_diff = new_value - curr_value
-            op = "" if value_diff < 0 else "+"
+        value_diff = new_value - curr_value
+        op = "" if value_diff < 0 else "+"
 
-            output = f"{value_type.capitalize()}: {new_value}"
-            if value_type == "health" or value_type == "magic":
-                output += f"/{balances[f'{value_type}_maximum']}"
-            output += f" ({op}{value_diff})"
+        output = f"{value_type.capitalize()}: {new_value}"
+        if value_type == "health" or value_type == "magic":
+            output += f"/{balances[f'{value_type}_maximum']}"
+        output += f" ({op}{value_diff})"
 
-            await ctx.send(output)
+        return output
 
     @game.command()
     async def longrest(self, ctx):
         """Set health and magic values to maximum."""
-        sheet_id = await self.config.user(ctx.author).active_char()
+        data = await self._get_user_data(ctx.author)
+        sheet_id = data['active_char']
         if sheet_id is None:
-            await ctx.send("No character is active. `import` a new character or switch to an " + \
-                "existing one with `character setactive`.")
+            await self._send(ctx, "No character is active. `import` a new character or switch " + \
+                "to an existing one with `character setactive`.")
             return
 
-        data = await self.config.user(ctx.author).characters()
-        char_data = data[sheet_id]
-
-        async with self.config.user(ctx.author).csettings() as settings:
-            balances = settings[sheet_id]['balances']
+        async with self._locks.lock((ctx.author.id, sheet_id)):
+            _, settings = await self._get_character(ctx.author, sheet_id)
+            balances = settings['balances']
 
             health_diff = balances['health_maximum'] - balances['health']
             health_op = "" if health_diff < 0 else "+"
@@ -1199,10 +2553,12 @@ class CthulhuCaller(commands.Cog):
             magic_diff = balances['magic_maximum'] - balances['magic']
             magic_op = "" if magic_diff < 0 else "+"
             balances['magic'] = balances['magic_maximum']
+            self._journal_balances(ctx.author, sheet_id, balances)
+            self._bump_sheet_version(ctx.author, sheet_id, SHEET_BALANCES)
 
             output = f"Health: {balances['health']} ({health_op}{health_diff})\n" + \
                 f"Magic: {balances['magic']} ({magic_op}{magic_diff})"
-            await ctx.send(output)
+        await self._send(ctx, output)
 
     @commands.command(aliases=["downtime", "progress", "progression"])
     async def improve(self, ctx, *, query):
@@ -1212,12 +2568,13 @@ class CthulhuCaller(commands.Cog):
         """
         skills = query.split(" ")
         if len(skills) < 5 or not all([sk.isnumeric() for sk in skills[:5]]):
-            await ctx.send("Could not read input as five space-separated integers.")
+            await self._send(ctx, "Could not read input as five space-separated integers.")
             return
 
-        hundred_rolls = [d20.roll("1d100") for i in range(5)]
-        improvements = [d20.roll("1d10") if hundred_rolls[i].total > int(skills[i]) else None \
-            for i in range(5)]
+        with self.metrics.phase("roll"):
+            hundred_rolls = [roll_dice("1d100") for i in range(5)]
+            improvements = [roll_dice("1d10") if hundred_rolls[i].total > int(skills[i]) \
+                else None for i in range(5)]
 
         embed = await self._get_base_embed(ctx)
         embed.title = "Skill Improvement rolls!"
@@ -1232,4 +2589,314 @@ class CthulhuCaller(commands.Cog):
 
             embed.add_field(name=f"Skill {i + 1}", value=field_text, inline=False)
         
-        await ctx.send(embed=embed)
+        await self._send(ctx, embed=embed)
+
+    @commands.group()
+    @commands.guild_only()
+    async def keeper(self, ctx):
+        """Commands for keepers to keep track of their party."""
+
+    @keeper.command(name="add")
+    @commands.mod_or_permissions(manage_messages=True)
+    async def keeper_add(self, ctx, *members: discord.Member):
+        """Add players to this server's party, to be shown on its dashboard."""
+        if not members:
+            await ctx.send_help()
+            return
+
+        async with self._locks.lock((None, ctx.guild.id)):
+            await self._load_party(ctx.guild)
+            party = list(self._party.members(ctx.guild.id).keys())
+            added = [member for member in members if member.id not in party]
+            if len(party) + len(added) > PARTY_MAX_SIZE:
+                await self._send(ctx, f"A party can have at most {PARTY_MAX_SIZE} players.")
+                return
+
+            for member in added:
+                party.append(member.id)
+                self._party.add(ctx.guild.id, member.id)
+            await self.config.guild(ctx.guild).party.set(party)
+        self._party_changed([ctx.guild.id])
+
+        await self._send(ctx, f"{len(added)} added to the party, which now has {len(party)} " + \
+            "players.")
+
+    @keeper.command(name="remove")
+    @commands.mod_or_permissions(manage_messages=True)
+    async def keeper_remove(self, ctx, *members: discord.Member):
+        """Remove players from this server's party."""
+        if not members:
+            await ctx.send_help()
+            return
+
+        async with self._locks.lock((None, ctx.guild.id)):
+            await self._load_party(ctx.guild)
+            removed = {member.id for member in members} & \
+                set(self._party.members(ctx.guild.id).keys())
+            for member_id in removed:
+                self._party.remove(ctx.guild.id, member_id)
+            party = list(self._party.members(ctx.guild.id).keys())
+            await self.config.guild(ctx.guild).party.set(party)
+        self._party_changed([ctx.guild.id])
+
+        await self._send(ctx, f"{len(removed)} removed from the party, which now has " + \
+            f"{len(party)} players.")
+
+    @keeper.command(name="dashboard", aliases=["dash"])
+    @commands.mod_or_permissions(manage_messages=True)
+    async def keeper_dashboard(self, ctx):
+        """Show the Luck, Sanity, Health and Magic of everyone in this server's party."""
+        await self._load_party(ctx.guild)
+        await self._send(ctx, embed=await self._get_dashboard_embed(ctx.guild))
+
+    @keeper.command(name="pin")
+    @commands.mod_or_permissions(manage_messages=True)
+    async def keeper_pin(self, ctx):
+        """Post the dashboard here and pin it, then keep it up to date as the party changes.
+
+        Only one dashboard per server is kept up to date, so this replaces any earlier one.
+        """
+        await self._load_party(ctx.guild)
+        message = await self._send(ctx, embed=await self._get_dashboard_embed(ctx.guild))
+        try:
+            await message.pin()
+        except discord.HTTPException:
+            await self._send(ctx, "Couldn't pin the dashboard, but it will still be kept up to " + \
+                "date.")
+
+        self._dashboards[ctx.guild.id] = (ctx.channel.id, message.id)
+        await self.config.guild(ctx.guild).dashboard.set([ctx.channel.id, message.id])
+
+    @keeper.command(name="unpin")
+    @commands.mod_or_permissions(manage_messages=True)
+    async def keeper_unpin(self, ctx):
+        """Stop keeping this server's dashboard up to date."""
+        if self._dashboards.pop(ctx.guild.id, None) is None and \
+            await self.config.guild(ctx.guild).dashboard() is None:
+            await self._send(ctx, "No dashboard is being kept up to date in this server.")
+            return
+
+        await self.config.guild(ctx.guild).dashboard.clear()
+        await self._send(ctx, "The dashboard will no longer be kept up to date.")
+
+    async def _load_parties(self):
+        """Start keeping every guild's party, so live dashboards are edited as soon as anything
+        changes. Members' characters are only read once they're needed.
+        """
+        for guild_id, guild_data in (await self.config.all_guilds()).items():
+            if guild_data.get('party'):
+                self._party.load(guild_id, guild_data['party'])
+            if guild_data.get('dashboard'):
+                self._dashboards[guild_id] = tuple(guild_data['dashboard'])
+
+    async def _load_party(self, guild):
+        if not self._party.has(guild.id):
+            guild_data = await self.config.guild(guild).all()
+            self._party.load(guild.id, guild_data['party'])
+            if guild_data['dashboard']:
+                self._dashboards[guild.id] = tuple(guild_data['dashboard'])
+
+    async def _get_dashboard_embed(self, guild):
+        """Render the guild's party, reading only the members that aren't known yet."""
+        party = self._party.members(guild.id)
+
+        unknown = [(member_id, self._party.changes(member_id)) for member_id, member in
+            party.items() if member is None]
+        found = await asyncio.gather(*[self._get_active_character(discord.Object(id=member_id))
+            for member_id, _ in unknown])
+        # what was read is shown even if it can't be kept
+        members = dict(party)
+        for (member_id, changes), (_, sheet_id, char, settings) in zip(unknown, found):
+            members[member_id] = PartyMember(None, None, None) if char is None else \
+                PartyMember(sheet_id, char.name, dict(settings['balances']))
+            self._party.set(guild.id, member_id, members[member_id], changes)
+
+        embed = discord.Embed(title="Party")
+        if not members:
+            embed.description = "No one is in the party yet. Add players with `keeper add`."
+            return embed
+
+        fields = []
+        for member_id, member in members.items():
+            discord_member = guild.get_member(member_id)
+            player = discord_member.display_name if discord_member is not None else "Unknown player"
+            if member.sheet_id is None:
+                fields.append((player.lower(), player, "No active character."))
+                continue
+
+            balances = member.balances
+            fields.append((member.name.lower(), f"{member.name} ({player})",
+                f"**Luck**: {balances['luck']} **Sanity**: {balances['sanity']} " + \
+                f"**Health**: {balances['health']}/{balances['health_maximum']} " + \
+                f"**Magic**: {balances['magic']}/{balances['magic_maximum']}"))
+
+        for _, name, value in sorted(fields):
+            embed.add_field(name=name, value=value, inline=False)
+
+        return embed
+
+    def _party_changed(self, guild_ids):
+        """Schedule an edit of each guild's live dashboard, if it has one and none is scheduled."""
+        for guild_id in guild_ids:
+            if guild_id in self._dashboards and guild_id not in self._dashboard_edits:
+                self._dashboard_edits[guild_id] = asyncio.create_task(
+                    self._edit_dashboard(guild_id))
+
+    async def _edit_dashboard(self, guild_id: int):
+        await asyncio.sleep(DASHBOARD_EDIT_DELAY)
+        # anything changing from here on needs another edit
+        self._dashboard_edits.pop(guild_id, None)
+
+        location = self._dashboards.get(guild_id)
+        guild = self.bot.get_guild(guild_id)
+        if location is None or guild is None:
+            return
+        channel = guild.get_channel(location[0])
+        if channel is None:
+            return
+
+        await self._load_party(guild)
+        embed = await self._get_dashboard_embed(guild)
+        try:
+            await channel.get_partial_message(location[1]).edit(embed=embed)
+        except discord.NotFound:
+            # the message was deleted, so there's nothing to keep up to date
+            self._dashboards.pop(guild_id, None)
+            await self.config.guild(guild).dashboard.clear()
+        except discord.HTTPException:
+            pass
+
+    @commands.group()
+    @commands.is_owner()
+    async def cthulhuset(self, ctx):
+        """Commands for bot owner settings."""
+
+    @cthulhuset.command(name="timeout")
+    async def cthulhuset_timeout(self, ctx, connect: float, read: float):
+        """Set the connect and read timeouts, in seconds, for fetching sheets.
+
+        Example:
+        `[p]cthulhuset timeout 10 30`
+        """
+        if connect <= 0 or read <= 0:
+            await self._send(ctx, "Timeouts should be greater than zero.")
+            return
+
+        await self.config.connect_timeout.set(connect)
+        await self.config.read_timeout.set(read)
+
+        await self._send(ctx, f"Sheets will now be fetched with a {connect}s connect timeout " + \
+            f"and a {read}s read timeout.")
+
+    @cthulhuset.command(name="warmup")
+    async def cthulhuset_warmup(self, ctx, days: int):
+        """Set how recently users must have used a command to have their data read on load.
+
+        Their data and active characters are then ready for their first commands after a restart.
+        Set to 0 to read nothing ahead of time.
+        """
+        if days < 0:
+            await self._send(ctx, "Days should be 0 or more.")
+            return
+
+        await self.config.warm_up_days.set(days)
+        if days:
+            await self._send(ctx, f"Users active in the last {days} days will have their data " + \
+                "read in when the cog is loaded.")
+        else:
+            await self._send(ctx, "No data will be read in ahead of time when the cog is loaded.")
+
+    @cthulhuset.command(name="sync")
+    async def cthulhuset_sync(self, ctx, minutes: int):
+        """Set how often, in minutes, every sheet imported from a link is checked for changes.
+
+        Changed sheets are updated as if their owners had used `update`, so nobody starts a
+        session with out of date characters. Set to 0 to turn this off.
+        """
+        if minutes < 0:
+            await self._send(ctx, "Minutes should be 0 or more.")
+            return
+
+        await self.config.sync_interval.set(minutes)
+        if minutes:
+            await self._send(ctx, f"Sheets will be checked for changes every {minutes} minutes.")
+        else:
+            await self._send(ctx, "Sheets will no longer be checked for changes.")
+
+    @cthulhuset.command(name="locks")
+    async def cthulhuset_locks(self, ctx):
+        """Show how often commands have had to wait on each other since the cog was loaded."""
+        locks = self._locks
+        average = locks.wait_total / locks.contended * 1000 if locks.contended else 0
+        await self._send(ctx, f"{locks.acquired} locks taken, {locks.contended} of them after " + \
+            f"waiting (average wait {average:.1f}ms, longest " + \
+            f"{locks.wait_max * 1000:.1f}ms).\n{locks.held()} currently held or waited on.")
+
+    @cthulhuset.command(name="metricsfile")
+    async def cthulhuset_metricsfile(self, ctx, path: str=""):
+        """Set a file to keep writing metrics to, in the Prometheus text format.
+
+        The file is rewritten every few seconds, for something like node_exporter's textfile
+        collector to pick up. Leave out the path to stop writing it.
+        """
+        if not path:
+            await self.config.metrics_path.set(None)
+            await self._send(ctx, "Metrics will no longer be written to a file.")
+            return
+
+        try:
+            self.metrics.export(path)
+        except OSError as e:
+            await self._send(ctx, f"Couldn't write metrics to `{path}`: {e}")
+            return
+
+        await self.config.metrics_path.set(path)
+        await self._send(ctx, f"Metrics will be written to `{path}` every " + \
+            f"{METRICS_EXPORT_INTERVAL} seconds.")
+
+    @commands.command()
+    @commands.is_owner()
+    async def cthulhustats(self, ctx, *, command: str=""):
+        """Show how long commands have been taking, over their last uses.
+
+        Optionally takes a command name, to break its time down by phase (reading config,
+        fetching sheets, rolling, sending and so on).
+        """
+        metrics = self.metrics
+        if command:
+            # background work only has phases
+            rows = sorted([(phase, histogram) for (name, phase), histogram in
+                metrics.phases.items() if name == command], key=lambda row: row[0])
+            if command in metrics.commands:
+                rows.insert(0, ("total", metrics.commands[command]))
+            if not rows:
+                await self._send(ctx, f"`{command}` hasn't been used since the cog was loaded.")
+                return
+            label = "phase"
+        else:
+            rows = sorted(metrics.commands.items(), key=lambda row: row[0])
+            if not rows:
+                await self._send(ctx, "No commands have been used since the cog was loaded.")
+                return
+            label = "command"
+
+        lines = [f"{label:<24}{'uses':>7}{'p50':>9}{'p95':>9}{'p99':>9}"]
+        for name, histogram in rows:
+            p50, p95, p99 = [value * 1000 for value in histogram.quantiles()]
+            lines.append(f"{name:<24}{histogram.count:>7}{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}")
+
+        hit_rates = []
+        for cache in ["users", "characters", "skill_indexes", "sheet_embeds"]:
+            rate = metrics.hit_rate(cache)
+            if rate is not None:
+                hit_rates.append(f"{cache} {rate:.0%}")
+
+        footer = "Times are in ms. " + \
+            f"{metrics.operations['config_read']} config reads, " + \
+            f"{metrics.operations['config_write']} config writes."
+        if hit_rates:
+            footer += f"\nCache hit rates: {', '.join(hit_rates)}."
+
+        for page in pagify("\n".join(lines)):
+            await self._send(ctx, box(page))
+        await self._send(ctx, footer)
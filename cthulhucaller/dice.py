@@ -0,0 +1,290 @@
+import functools
+import math
+import random
+
+from fractions import Fraction
+
+# how many distinct dice expressions to keep parsed
+DICE_CACHE_SIZE = 1024
+# how many random values to draw from the source at a time
+DICE_BUFFER_SIZE = 4096
+# how many (dc, net dice) pairs to keep worked-out odds for
+ODDS_CACHE_SIZE = 512
+# most net bonus or penalty dice a check can have, which keeps a roll's text small enough to send
+MAX_NET_DICE = 50
+
+# outcomes of a roll, best first
+CRITICAL = 0
+EXTREME = 1
+HARD = 2
+REGULAR = 3
+FAILURE = 4
+# a 96 to 99, which is only a fumble when success needs a roll below 50
+FUMBLE_BELOW_50 = 5
+FUMBLE = 6
+
+OUTCOME_TEXTS = ["**Critical Success**", "**Extreme Success**", "**Hard Success**",
+    "**Regular Success**", "**Failure**", "**Fumble** (if success requires a result below 50)",
+    "**Fumble**"]
+OUTCOME_RESEARCH_POINTS = [6, 4, 2, 1, 0, 0, 0]
+
+LUCK_TARGETS = ["Regular", "Hard", "Extreme"]
+
+# outcomes are looked up for dcs up to this, and worked out on the spot past it
+TABLE_MAX_DC = 100
+
+
+class TooManyDice(ValueError):
+    """Raised for a check with more than MAX_NET_DICE net bonus or penalty dice."""
+
+
+def check_net_dice(net_dice: int):
+    if abs(net_dice) > MAX_NET_DICE:
+        raise TooManyDice(net_dice)
+
+
+class UnrollableDice(ValueError):
+    """Raised for a dice expression that can't be rolled, with the expression and the reason."""
+
+
+# d20 builds its dice grammar when imported, which takes long enough to be put off until it's
+# needed (plain checks don't go through it at all)
+def load_d20():
+    """Import d20 ahead of the first roll that needs it."""
+    import d20
+    return d20
+
+
+@functools.lru_cache(maxsize=DICE_CACHE_SIZE)
+def parse_dice(expr: str):
+    """Parse a dice expression into something d20 can roll, once per distinct expression."""
+    return load_d20().parse(expr)
+
+
+def roll_dice(expr: str):
+    return load_d20().roll(parse_dice(expr))
+
+
+def is_dice(expr: str):
+    """Check that an expression parses, without rolling it."""
+    d20 = load_d20()
+    try:
+        parse_dice(expr)
+        return True
+    except d20.RollError:
+        return False
+
+
+def roll_total(expr: str):
+    """Roll a dice expression for its total.
+
+    Raises UnrollableDice for one that parses but can't be rolled, like 1/0 or 1001d6.
+    """
+    d20 = load_d20()
+    try:
+        return d20.roll(parse_dice(expr)).total
+    except d20.RollError as e:
+        raise UnrollableDice(expr, str(e)) from e
+
+
+def _work_out_outcome(dc: int, roll_total: int):
+    extreme_dc = math.floor(dc / 5)
+    hard_dc = math.floor(dc / 2)
+
+    if roll_total == 1:
+        return CRITICAL, None, None, None
+    elif roll_total <= extreme_dc:
+        return EXTREME, None, None, None
+    elif roll_total <= hard_dc:
+        return HARD, None, None, roll_total - extreme_dc
+    elif roll_total <= dc:
+        return REGULAR, None, roll_total - hard_dc, roll_total - extreme_dc
+    elif roll_total > 99:
+        return FUMBLE, None, None, None
+    elif roll_total >= 96:
+        return FUMBLE_BELOW_50, None, None, None
+    else:
+        return FAILURE, roll_total - dc, roll_total - hard_dc, roll_total - extreme_dc
+
+
+# dc -> roll total (by index) -> outcome, worked out once for every ordinary dc
+OUTCOME_TABLE = [[None] + [_work_out_outcome(dc, total) for total in range(1, 101)]
+    for dc in range(TABLE_MAX_DC + 1)]
+
+
+def get_outcome(dc: int, roll_total: int):
+    """Get the outcome of a roll, and the Luck needed to push it to Regular, Hard and Extreme
+    (None where Luck can't help or isn't needed).
+    """
+    if 0 <= dc <= TABLE_MAX_DC and 1 <= roll_total <= 100:
+        return OUTCOME_TABLE[dc][roll_total]
+    return _work_out_outcome(dc, roll_total)
+
+
+@functools.lru_cache(maxsize=ODDS_CACHE_SIZE)
+def total_odds(net_dice: int):
+    """Get the exact chance of each total from 1 to 100 (by index) with net bonus/penalty dice."""
+    odds = [Fraction(0)] * 101
+    if net_dice == 0:
+        for total in range(1, 101):
+            odds[total] = Fraction(1, 100)
+        return odds
+
+    # bonus dice keep the lowest tens die, penalty dice the highest
+    count = abs(net_dice) + 1
+    for tens in range(10):
+        if net_dice > 0:
+            ways = (10 - tens) ** count - (9 - tens) ** count
+        else:
+            ways = (tens + 1) ** count - tens ** count
+
+        for ones in range(1, 11):
+            odds[(tens * 10) + ones] += Fraction(ways, (10 ** count) * 10)
+
+    return odds
+
+
+@functools.lru_cache(maxsize=ODDS_CACHE_SIZE)
+def check_odds(dc: int, net_dice: int):
+    """Work out the exact odds of a check.
+
+    Returns the chance of each outcome (by index), and for each of LUCK_TARGETS, the chance that
+    spending Luck could reach it and how much Luck that takes on average when it can. A 96 to 99
+    is counted as a fumble when the dc is below 50 and as a failure otherwise, and can't be
+    pushed either way.
+
+    Raises TooManyDice past MAX_NET_DICE, as the exact odds get slow to work out with many dice.
+    """
+    check_net_dice(net_dice)
+    chances = [Fraction(0)] * len(OUTCOME_TEXTS)
+    luck_chances = [Fraction(0)] * len(LUCK_TARGETS)
+    luck_totals = [Fraction(0)] * len(LUCK_TARGETS)
+
+    for total, chance in enumerate(total_odds(net_dice)):
+        if not chance:
+            continue
+
+        outcome, *luck_costs = get_outcome(dc, total)
+        if outcome == FUMBLE_BELOW_50:
+            outcome = FUMBLE if dc < 50 else FAILURE
+        chances[outcome] += chance
+
+        for i, cost in enumerate(luck_costs):
+            if cost is not None:
+                luck_chances[i] += chance
+                luck_totals[i] += chance * cost
+
+    luck = [(luck_chances[i], luck_totals[i] / luck_chances[i] if luck_chances[i] else None)
+        for i in range(len(LUCK_TARGETS))]
+
+    return chances, luck
+
+
+class PercentileDice:
+    """Rolls the d100 checks directly, without going through d20.
+
+    Only handles the shapes a check is made of, a plain 1d100 or tens dice with a 1d10 for the
+    ones, but writes them out the same way d20 does. Anything else should still go to d20.
+
+    Random values are drawn in bulk from rng, which can be anything with the stdlib random API
+    (such as random.Random(seed) for repeatable rolls) or a numpy Generator.
+    """
+
+    def __init__(self, rng=None, buffer_size: int=DICE_BUFFER_SIZE):
+        self.rng = rng if rng is not None else random.Random()
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._next = 0
+
+    def _refill(self):
+        if hasattr(self.rng, 'integers'):
+            self._buffer = self.rng.integers(0, 100, size=self.buffer_size).tolist()
+        else:
+            self._buffer = self.rng.choices(range(100), k=self.buffer_size)
+        self._next = 0
+
+    def _draw(self):
+        """Get a value from 0 to 99."""
+        if self._next >= len(self._buffer):
+            self._refill()
+        value = self._buffer[self._next]
+        self._next += 1
+        return value
+
+    def _draw_many(self, count: int):
+        """Get count values from 0 to 99 at once."""
+        values = self._buffer[self._next:self._next + count]
+        self._next += len(values)
+        while len(values) < count:
+            self._refill()
+            more = self._buffer[:count - len(values)]
+            self._next = len(more)
+            values += more
+
+        return values
+
+    def d100(self):
+        return self._draw() + 1
+
+    def d10(self):
+        return self._draw() % 10 + 1
+
+    def roll_check(self, net_dice: int):
+        """Roll a check with net bonus (positive) or penalty (negative) dice.
+
+        Returns the total and the roll text. Raises TooManyDice past MAX_NET_DICE.
+        """
+        check_net_dice(net_dice)
+        if net_dice == 0:
+            # no need to show extra dice, simplify to a d100
+            total = self.d100()
+            return total, f"1d100 ({self._die_text(total, 100)}) = `{total}`"
+
+        # tens is 0-indexed: 00 through 90
+        count = abs(net_dice) + 1
+        dice = [self.d10() for i in range(count)]
+        kept = dice.index(min(dice) if net_dice > 0 else max(dice))
+        tens = dice[kept] - 1
+
+        dice_text = ", ".join([self._die_text(die, 10) if i == kept else
+            f"~~{self._die_text(die, 10)}~~" for i, die in enumerate(dice)])
+        keep = "kl1" if net_dice > 0 else "kh1"
+        tens_text = f"{count}d10{keep} ({dice_text}) - 1 = `{tens}`"
+
+        # ones is 1-indexed: 01 through 10
+        ones = self.d10()
+        ones_text = f"1d10 ({self._die_text(ones, 10)}) = `{ones}`"
+
+        total = (tens * 10) + ones
+        return total, f"{tens_text}, {ones_text} -> `{total}`"
+
+    def roll_totals(self, net_dice: list):
+        """Roll one check for each net dice value in the list, returning only the totals.
+
+        Every value needed for the whole batch is drawn at once. Raises TooManyDice if any value
+        is past MAX_NET_DICE.
+        """
+        for net in set(net_dice):
+            check_net_dice(net)
+        values = self._draw_many(sum([abs(net) + 2 if net else 1 for net in net_dice]))
+
+        totals = []
+        i = 0
+        for net in net_dice:
+            if not net:
+                totals.append(values[i] + 1)
+                i += 1
+                continue
+
+            count = abs(net) + 1
+            # the dice are 0-indexed here, which is already the tens digit
+            tens = [value % 10 for value in values[i:i + count]]
+            tens = min(tens) if net > 0 else max(tens)
+            totals.append((tens * 10) + (values[i + count] % 10) + 1)
+            i += count + 1
+
+        return totals
+
+    def _die_text(self, value: int, size: int):
+        # d20 bolds the lowest and highest faces
+        return f"**{value}**" if value == 1 or value == size else f"{value}"
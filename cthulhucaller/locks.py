@@ -0,0 +1,56 @@
+import asyncio
+import contextlib
+import time
+
+
+class LockManager:
+    """Hands out one lock per key, so work on the same key happens in order while work on
+    different keys runs in parallel.
+
+    A key's lock only exists while something holds or waits for it. Time spent waiting is
+    tallied for reporting.
+    """
+
+    def __init__(self):
+        self._locks = {}
+        # key -> how many are holding or waiting for its lock
+        self._users = {}
+
+        self.acquired = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @contextlib.asynccontextmanager
+    async def lock(self, key):
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+            self._users[key] = 0
+        self._users[key] += 1
+
+        try:
+            if lock.locked():
+                self.contended += 1
+                start = time.perf_counter()
+                await lock.acquire()
+                wait = time.perf_counter() - start
+                self.wait_total += wait
+                self.wait_max = max(self.wait_max, wait)
+            else:
+                await lock.acquire()
+            self.acquired += 1
+
+            try:
+                yield
+            finally:
+                lock.release()
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+    def held(self):
+        """Get how many keys are currently locked or waited on."""
+        return len(self._locks)
@@ -0,0 +1,178 @@
+import collections
+import contextvars
+import math
+import os
+import time
+
+# how many of the most recent samples each histogram keeps for working out quantiles
+HISTOGRAM_SIZE = 1000
+QUANTILES = [0.5, 0.95, 0.99]
+
+# phases timed outside of any command, like flushing balances, are filed under this
+BACKGROUND = "background"
+
+# the command being run in the current task, if any
+_invocation = contextvars.ContextVar("cthulhucaller_invocation", default=None)
+
+
+class RollingHistogram:
+    """Keeps the latest samples for quantiles, and running totals over every sample."""
+
+    __slots__ = ['samples', 'count', 'total']
+
+    def __init__(self, size: int=HISTOGRAM_SIZE):
+        self.samples = collections.deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value: float):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self, quantiles: list=QUANTILES):
+        """Get the nearest-rank value at each quantile of the latest samples."""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return [0.0 for q in quantiles]
+        return [ordered[max(0, math.ceil(q * len(ordered)) - 1)] for q in quantiles]
+
+
+class _Invocation:
+    __slots__ = ['command', 'start', 'phases']
+
+    def __init__(self, command: str):
+        self.command = command
+        self.start = time.perf_counter()
+        # phase -> seconds spent in it so far
+        self.phases = {}
+
+
+class _Phase:
+    # a plain class rather than contextlib.contextmanager, as this wraps every config access
+    __slots__ = ['metrics', 'name', 'start']
+
+    def __init__(self, metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.metrics._add_phase(self.name, time.perf_counter() - self.start)
+
+
+class Metrics:
+    """Times commands and the phases within them (config reads, fetches, rolls, sends...).
+
+    Each command's total time, and the time it spent in each phase, go into rolling histograms.
+    Phases run concurrently within one command (like fetching several sheets at once) add up, so
+    they can come to more than the command took.
+    """
+
+    def __init__(self):
+        # command -> RollingHistogram of seconds per invocation
+        self.commands = {}
+        # (command, phase) -> RollingHistogram of seconds per invocation
+        self.phases = {}
+        # phase -> how many times it has been entered, across all commands
+        self.operations = collections.Counter()
+        self.cache_hits = collections.Counter()
+        self.cache_misses = collections.Counter()
+
+    def start(self, command: str):
+        """Start timing a command for the rest of the current task."""
+        _invocation.set(_Invocation(command))
+
+    def finish(self):
+        """Stop timing the current task's command and record it."""
+        invocation = _invocation.get()
+        if invocation is None:
+            return
+        _invocation.set(None)
+
+        self._histogram(self.commands, invocation.command).add(
+            time.perf_counter() - invocation.start)
+        for phase, elapsed in invocation.phases.items():
+            self._histogram(self.phases, (invocation.command, phase)).add(elapsed)
+
+    def phase(self, name: str):
+        """Time a phase of the current command, or of the background work if there is none.
+
+        Used as a context manager around the phase.
+        """
+        return _Phase(self, name)
+
+    def _add_phase(self, name: str, elapsed: float):
+        self.operations[name] += 1
+        invocation = _invocation.get()
+        if invocation is None:
+            self._histogram(self.phases, (BACKGROUND, name)).add(elapsed)
+        else:
+            invocation.phases[name] = invocation.phases.get(name, 0.0) + elapsed
+
+    def hit(self, cache: str):
+        self.cache_hits[cache] += 1
+
+    def miss(self, cache: str):
+        self.cache_misses[cache] += 1
+
+    def hit_rate(self, cache: str):
+        """Get the share of lookups in a cache that were hits, or None if there were none."""
+        total = self.cache_hits[cache] + self.cache_misses[cache]
+        return self.cache_hits[cache] / total if total else None
+
+    @staticmethod
+    def _histogram(histograms: dict, key):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = RollingHistogram()
+        return histogram
+
+    def to_prometheus(self):
+        """Render everything in the Prometheus text exposition format."""
+        lines = []
+
+        lines.append("# HELP cthulhucaller_command_seconds Time taken by each command.")
+        lines.append("# TYPE cthulhucaller_command_seconds summary")
+        for command, histogram in sorted(self.commands.items()):
+            lines.extend(_summary_lines("cthulhucaller_command_seconds",
+                f'command="{command}"', histogram))
+
+        lines.append("# HELP cthulhucaller_phase_seconds Time each command spent in each phase.")
+        lines.append("# TYPE cthulhucaller_phase_seconds summary")
+        for (command, phase), histogram in sorted(self.phases.items()):
+            lines.extend(_summary_lines("cthulhucaller_phase_seconds",
+                f'command="{command}",phase="{phase}"', histogram))
+
+        lines.append("# HELP cthulhucaller_operations_total Times each phase has been entered.")
+        lines.append("# TYPE cthulhucaller_operations_total counter")
+        for phase, count in sorted(self.operations.items()):
+            lines.append(f'cthulhucaller_operations_total{{phase="{phase}"}} {count}')
+
+        lines.append("# HELP cthulhucaller_cache_lookups_total Cache lookups by result.")
+        lines.append("# TYPE cthulhucaller_cache_lookups_total counter")
+        for cache in sorted(set(self.cache_hits) | set(self.cache_misses)):
+            lines.append(f'cthulhucaller_cache_lookups_total{{cache="{cache}",result="hit"}} ' + \
+                f"{self.cache_hits[cache]}")
+            lines.append(f'cthulhucaller_cache_lookups_total{{cache="{cache}",result="miss"}} ' + \
+                f"{self.cache_misses[cache]}")
+
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str):
+        """Write the Prometheus text to a file, replacing it whole so it's never read half-written.
+        """
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(temp_path, path)
+
+
+def _summary_lines(name: str, labels: str, histogram: RollingHistogram):
+    lines = [f'{name}{{{labels},quantile="{q}"}} {value:.6f}'
+        for q, value in zip(QUANTILES, histogram.quantiles())]
+    lines.append(f"{name}_sum{{{labels}}} {histogram.total:.6f}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
@@ -0,0 +1,101 @@
+class PartyMember:
+    """What a party's dashboard shows for one member: their active character and its balances."""
+
+    __slots__ = ['sheet_id', 'name', 'balances']
+
+    def __init__(self, sheet_id: str, name: str, balances: dict):
+        self.sheet_id = sheet_id
+        self.name = name
+        self.balances = balances
+
+
+class PartyIndex:
+    """Keeps each guild's party, by member, kept in step as their characters change.
+
+    A member's entry is None until it's been read, and goes back to None when they switch
+    characters, so it's read again the next time it's needed. Changes to balances and names are
+    applied straight to the entries, so showing a party only reads what isn't known yet.
+    """
+
+    def __init__(self):
+        # guild id -> member id -> PartyMember (with a sheet id of None if no character is
+        # active), or None if not read yet
+        self._parties = {}
+        # member id -> ids of the guilds whose parties they're in
+        self._guilds = {}
+        # member id -> how many changes have been applied to them, so an entry read while one
+        # was being made isn't kept
+        self._changes = {}
+
+    def has(self, guild_id: int):
+        return guild_id in self._parties
+
+    def load(self, guild_id: int, member_ids: list):
+        """Start keeping a guild's party, unless it already is."""
+        if guild_id in self._parties:
+            return
+
+        self._parties[guild_id] = {}
+        for member_id in member_ids:
+            self.add(guild_id, member_id)
+
+    def add(self, guild_id: int, member_id: int):
+        party = self._parties[guild_id]
+        if member_id not in party:
+            party[member_id] = None
+            self._guilds.setdefault(member_id, set()).add(guild_id)
+
+    def remove(self, guild_id: int, member_id: int):
+        self._parties[guild_id].pop(member_id, None)
+        guilds = self._guilds.get(member_id, set())
+        guilds.discard(guild_id)
+        if not guilds:
+            self._guilds.pop(member_id, None)
+            self._changes.pop(member_id, None)
+
+    def members(self, guild_id: int):
+        """Get the guild's party, as member id -> PartyMember (or None if not read yet)."""
+        return self._parties[guild_id]
+
+    def changes(self, member_id: int):
+        """Get a count of the member's changes, to pass to set after reading their entry."""
+        return self._changes.get(member_id, 0)
+
+    def set(self, guild_id: int, member_id: int, member: PartyMember, changes: int):
+        """Fill in a member's entry, unless they've changed since it was read."""
+        if member_id in self._parties[guild_id] and self.changes(member_id) == changes:
+            self._parties[guild_id][member_id] = member
+
+    def update(self, member_id: int, sheet_id: str, name: str=None, balances: dict=None):
+        """Apply a change to one of a member's characters. Only their active one is kept, so
+        changes to any other are ignored.
+
+        Returns the ids of the guilds whose parties the member is in.
+        """
+        guild_ids = set(self._guilds.get(member_id, set()))
+        if guild_ids:
+            self._changes[member_id] = self.changes(member_id) + 1
+        for guild_id in guild_ids:
+            member = self._parties[guild_id][member_id]
+            if member is None or member.sheet_id != sheet_id:
+                continue
+
+            if name is not None:
+                member.name = name
+            if balances is not None:
+                member.balances = dict(balances)
+
+        return guild_ids
+
+    def invalidate(self, member_id: int):
+        """Forget what's known about a member, for when they switch characters.
+
+        Returns the ids of the guilds whose parties the member is in.
+        """
+        guild_ids = set(self._guilds.get(member_id, set()))
+        if guild_ids:
+            self._changes[member_id] = self.changes(member_id) + 1
+        for guild_id in guild_ids:
+            self._parties[guild_id][member_id] = None
+
+        return guild_ids
@@ -0,0 +1,53 @@
+import re
+
+KNOWN_FLAGS = ["bonus", "penalty", "phrase", "rr", "odds"]
+FLAG_ALIASES = {
+    'b': "bonus",
+    'adv': "bonus",
+    'dis': "penalty"
+}
+DOUBLE_QUOTES = ["\"", "“", "”"]
+
+# a flag on its own, or a quoted span (which is skipped over, so flags in a phrase are just words)
+QUERY_TOKEN_RE = re.compile(
+    r"[{0}][^{0}]*[{0}]|(?<!\S)-({1})(?!\S)".format("".join(DOUBLE_QUOTES),
+        "|".join(KNOWN_FLAGS + list(FLAG_ALIASES.keys()))))
+
+
+def parse_query(query_str: str):
+    """Split a check query into the check itself and the args given to each flag.
+
+    Flags can be repeated, so each one maps to a list of args, in order.
+    """
+    processed_flags = get_base_flags()
+
+    flag_locs = []
+    for match in QUERY_TOKEN_RE.finditer(query_str):
+        if match.group(1) is not None:
+            flag = FLAG_ALIASES.get(match.group(1), match.group(1))
+            flag_locs.append((flag, match.start(), match.end()))
+
+    processed_flags['query'] = query_str[:flag_locs[0][1]].strip() if flag_locs else \
+        query_str.strip()
+
+    for i in range(len(flag_locs)):
+        flag, _, arg_start = flag_locs[i]
+        arg_end = flag_locs[i + 1][1] if i + 1 < len(flag_locs) else len(query_str)
+
+        arg = query_str[arg_start:arg_end].strip()
+        if len(arg) > 1 and arg[0] in DOUBLE_QUOTES and arg[-1] in DOUBLE_QUOTES:
+            arg = arg[1:-1]
+        elif not arg and flag in ["bonus", "penalty"]:
+            # a bare -adv or -dis is one die
+            arg = "1"
+
+        processed_flags[flag].append(arg)
+
+    return processed_flags
+
+
+def get_base_flags():
+    processed_flags = {'query': ""}
+    for flag in KNOWN_FLAGS:
+        processed_flags[flag] = []
+    return processed_flags
@@ -0,0 +1,90 @@
+import csv
+import hashlib
+import io
+import zipfile
+
+# sheets imported from a file have an id made of this and a hash of the file
+FILE_SHEET_PREFIX = "file-"
+
+# most an xlsx file may unpack to, as a small one can unpack to far more than a sheet's worth
+XLSX_MAX_UNPACKED_BYTES = 16 * 1024 * 1024
+
+
+class FileTooBig(ValueError):
+    """Raised for an xlsx file that would unpack to more than XLSX_MAX_UNPACKED_BYTES."""
+
+
+def file_digest(data: bytes):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_sheet_id(digest: str):
+    """Get the id for a sheet imported from a file from the file's digest, so it's the same for
+    every copy of the same file."""
+    return FILE_SHEET_PREFIX + digest[:32]
+
+
+def is_file_sheet(sheet_id: str):
+    return sheet_id.startswith(FILE_SHEET_PREFIX)
+
+
+def read_csv_rows(data: bytes, max_rows: int, min_columns: int):
+    """Read the rows of an exported csv file, stopping once there are more than max_rows.
+
+    Every row is padded out to at least min_columns cells.
+    """
+    rows = []
+    # exports from some spreadsheet programs start with a byte order mark
+    for row in csv.reader(io.StringIO(data.decode("utf-8-sig", errors="replace"))):
+        rows.append(row)
+        if len(rows) > max_rows:
+            break
+
+    return _pad_rows(rows, min_columns)
+
+
+def read_xlsx_rows(data: bytes, max_rows: int, min_columns: int):
+    """Read the rows of the first sheet of an exported xlsx file, as the text a csv export would
+    have, stopping once there are more than max_rows.
+
+    Every row is padded out to at least min_columns cells.
+
+    The file is streamed row by row rather than loaded whole. Needs openpyxl, and raises
+    ImportError without it. Raises FileTooBig, before reading anything, if the file would unpack
+    to too much.
+    """
+    # xlsx files are zip archives, which list the size of everything in them
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        if sum([info.file_size for info in archive.infolist()]) > XLSX_MAX_UNPACKED_BYTES:
+            raise FileTooBig()
+
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        rows = []
+        for row in workbook.worksheets[0].iter_rows(max_row=max_rows + 1, values_only=True):
+            rows.append([_cell_text(value) for value in row])
+    finally:
+        workbook.close()
+
+    return _pad_rows(rows, min_columns)
+
+
+def _pad_rows(rows: list, min_columns: int):
+    # spreadsheet programs may leave off empty cells at the ends of rows, where a published sheet
+    # keeps every row as wide as the template
+    width = max([len(row) for row in rows] + [min_columns])
+    for row in rows:
+        row.extend([""] * (width - len(row)))
+
+    return rows
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    # numbers are all whole on the sheet, but may be stored as floats
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)